@@ -37,14 +37,33 @@ class AccountsConfig(AppConfig):
 			rating.rating = sum(getattr(rating, w[0]) * w[1] for w in UserRating.RATING_WEIGHTS.items())
 			rating.save()
 
+	@cached_property
+	def deferred_user_content(self):
+		from comments.models import Comment
+		from .tasks import update_comments_rating
+
+		return {
+			Comment: ('user_id', update_comments_rating),
+		}
+
+	def update_deferred_count(self, sender, instance, **kwargs):
+		from common_utils.tasks import defer
+
+		if not sender in self.deferred_user_content:
+			return
+		author_property, task = self.deferred_user_content[sender]
+		user_id = getattr(instance, author_property)
+		if user_id:
+			defer(task, user_id, coalesce=True)
+
 	def update_count_post_save(self, sender, instance, **kwargs):
-		if not sender in self.user_content:
+		if not sender in self.user_content or sender in self.deferred_user_content:
 			return
 		author_property, property_name, count_fun = self.user_content[sender]
 		self.update_user_rating(instance, author_property, property_name, int(count_fun(instance)))
 
 	def update_count_pre_save(self, sender, instance, **kwargs):
-		if not sender in self.user_content:
+		if not sender in self.user_content or sender in self.deferred_user_content:
 			return
 		author_property, property_name, count_fun = self.user_content[sender]
 		if instance.pk:
@@ -87,9 +106,12 @@ class AccountsConfig(AppConfig):
 		post_delete.connect(clear_last_objects_cache)
 
 	def ready(self):
+		from . import tasks # pylint: disable=unused-import
 		pre_save.connect(self.update_count_pre_save)
 		pre_delete.connect(self.update_count_pre_save)
 		post_save.connect(self.update_count_post_save)
+		post_save.connect(self.update_deferred_count, sender='comments.Comment')
+		post_delete.connect(self.update_deferred_count, sender='comments.Comment')
 		user_logged_out.connect(self.remove_auth_token)
 		self.set_registration_active()
 		self.clear_last_objects_cache()
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from .models import UserRating
+from common_utils.tasks import deferred_task
+
+
+@deferred_task
+def update_comments_rating(user_id):
+	from comments.models import Comment
+
+	count = Comment.objects.filter(user_id=user_id, is_public=True, is_removed=False).count()
+	rating = UserRating.objects.get_or_create(user_id=user_id)[0]
+	rating.comments = count
+	rating.rating = sum(getattr(rating, w[0]) * w[1] for w in UserRating.RATING_WEIGHTS.items())
+	rating.save()
@@ -2,9 +2,7 @@
 from __future__ import unicode_literals
 
 from django.apps import AppConfig
-from django.contrib.auth import get_user_model
 from django.db.models.signals import post_save, post_delete
-from django.utils.encoding import force_text
 
 
 class CommentsConfig(AppConfig):
@@ -12,22 +10,48 @@ class CommentsConfig(AppConfig):
 	verbose_name = 'Komentáre'
 
 	def ready(self):
-		from .utils import update_comments_header
+		from . import tasks # pylint: disable=unused-import
 		Comment = self.get_model('Comment')
-		post_save.connect(update_comments_header, sender=Comment)
-		post_delete.connect(update_comments_header, sender=Comment)
+		post_save.connect(self.update_comments_header, sender=Comment)
+		post_delete.connect(self.update_comments_header, sender=Comment)
 		post_save.connect(self.send_notifications, sender=Comment)
+		post_save.connect(self.invalidate_discussion_cache, sender=Comment)
+		post_delete.connect(self.invalidate_discussion_cache, sender=Comment)
+		post_save.connect(self.invalidate_attachment_discussion_cache, sender='attachment.Attachment')
+		post_delete.connect(self.invalidate_attachment_discussion_cache, sender='attachment.Attachment')
+
+	def invalidate_discussion_cache(self, sender, instance, **kwargs): #pylint: disable=unused-argument
+		from .utils import invalidate_discussion_cache
+		invalidate_discussion_cache(instance.content_type_id, instance.object_id)
+
+	def invalidate_attachment_discussion_cache(self, sender, instance, **kwargs): #pylint: disable=unused-argument
+		from django.contrib.contenttypes.models import ContentType
+		from .utils import invalidate_discussion_cache
+		Comment = self.get_model('Comment')
+		if instance.content_type_id != ContentType.objects.get_for_model(Comment).pk:
+			return
+		discussion = Comment.objects.filter(pk=instance.object_id).values_list('content_type_id', 'object_id').first()
+		if discussion is not None:
+			invalidate_discussion_cache(*discussion)
+
+	def update_comments_header(self, sender, instance, **kwargs): #pylint: disable=unused-argument
+		from common_utils.tasks import defer
+		from .tasks import increment_discussion_header, update_discussion_header
+		from .utils import get_or_create_root_header
+
+		if instance.parent_id is None and 'created' in kwargs:
+			# diskusia sa zobrazuje hneď po vytvorení, hlavička musí existovať
+			if get_or_create_root_header(instance)[1]:
+				return
+		if kwargs.get('created') and instance.parent_id is not None and instance.is_public and not instance.is_removed:
+			defer(increment_discussion_header, instance.pk)
+		else:
+			defer(update_discussion_header, instance.content_type_id, instance.object_id, coalesce=True)
 
 	def send_notifications(self, sender, instance, created, **kwargs): #pylint: disable=unused-argument
-		from notifications.models import Event
+		from common_utils.tasks import defer
+		from .tasks import send_comment_notifications
 
-		if not created or not instance.parent:
+		if not created or not instance.parent_id:
 			return
-		watchers = (get_user_model().objects
-			.filter(userdiscussionattribute__discussion=instance.get_or_create_root_header(), userdiscussionattribute__watch=True)
-			.distinct())
-		title = "Pridaný komentár v diskusii " + force_text(instance.content_object)
-		author = None
-		if instance.user:
-			author = instance.user
-		Event.objects.broadcast(title, instance.content_object, action=Event.CREATE_ACTION, author=author, users=watchers)
+		defer(send_comment_notifications, instance.pk)
@@ -20,7 +20,9 @@ class CommentIndex(indexes.SearchIndex, indexes.Indexable):
 		return RootHeader
 
 	def index_queryset(self, using=None):
-		return self.get_model().objects.filter()
+		# prepare_author, prepare_title a výsledky vyhľadávania (read_queryset)
+		# načítajú content_object jedným dotazom pre každý typ obsahu
+		return self.get_model().objects.filter().prefetch_related('content_object')
 
 	def prepare_author(self, object):
 		content_object = object.content_object
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.auth import get_user_model
+from django.utils.encoding import force_text
+
+from .models import Comment
+from .utils import update_comments_header, increment_comments_header
+from common_utils.tasks import deferred_task
+
+
+@deferred_task
+def increment_discussion_header(comment_id):
+	comment = Comment.objects.filter(pk=comment_id).first()
+	if comment is None:
+		return
+	if not increment_comments_header(comment):
+		update_comments_header(Comment, instance=comment)
+
+
+@deferred_task
+def update_discussion_header(content_type_id, object_id):
+	root = Comment.objects.filter(content_type_id=content_type_id, object_id=object_id, parent=None).first()
+	if root is not None:
+		update_comments_header(Comment, instance=root)
+
+
+@deferred_task
+def send_comment_notifications(comment_id):
+	from notifications.models import Event
+
+	comment = Comment.objects.filter(pk=comment_id).select_related('user').first()
+	if comment is None:
+		return
+	watchers = (get_user_model().objects
+		.filter(userdiscussionattribute__discussion=comment.get_or_create_root_header(), userdiscussionattribute__watch=True)
+		.distinct())
+	title = "Pridaný komentár v diskusii " + force_text(comment.content_object)
+	Event.objects.broadcast(title, comment.content_object, action=Event.CREATE_ACTION, author=comment.user, users=watchers)
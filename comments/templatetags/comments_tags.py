@@ -2,8 +2,9 @@
 from __future__ import unicode_literals
 
 from django import template
+from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Count, Q, Case, When, BooleanField
+from django.db.models import Count, Q
 from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils import timezone
@@ -14,14 +15,25 @@ from jinja2 import contextfunction
 from mptt.templatetags import mptt_tags
 
 from ..models import RootHeader, UserDiscussionAttribute
+from ..utils import DISCUSSION_CACHE_MAX_AGE, COMMENTS_WINDOW_SIZE, COMMENTS_WINDOW_THRESHOLD, COMMENT_QUERY_PARAMETER, get_discussion_cache_tag, get_or_create_root_header
 from comments.models import Comment
 from common_utils import iterify, get_meta
+from common_utils.cache import cache_instance, get_or_recompute
 from common_utils.content_types import get_lookups
 
 
 register = template.Library()
 
 
+class DiscussionComments(list):
+	root_item = None
+	root_header = None
+	user_attribute = None
+	window = None
+	next_window = None
+	last_display_time = None
+
+
 class DiscussionLoader:
 	def __init__(self):
 		self.target = None
@@ -31,53 +43,115 @@ class DiscussionLoader:
 	def target_ctype(self):
 		return ContentType.objects.get_for_model(self.target)
 
-	@cached_property
-	def root_header(self):
-		object_id = self.target.pk
-		ctype = self.target_ctype
-		return RootHeader.objects.get(content_type=ctype, object_id=object_id)
+	def get_root_header(self):
+		header = self.find_root_header()
+		if header is not None:
+			return header
+		root = Comment.objects.get_or_create_root_comment(self.target_ctype, self.target.pk)[0]
+		return get_or_create_root_header(root)[0]
 
-	def get_queryset(self):
+	def find_root_header(self):
+		return RootHeader.objects.filter(content_type=self.target_ctype, object_id=self.target.pk).first()
+
+	def get_base_queryset(self):
 		object_id = self.target.pk
 		ctype = self.target_ctype
 		if not object_id:
 			return Comment.objects.none()
 
-		queryset = Comment.objects.filter(
+		return Comment.objects.filter(
 			content_type=ctype,
 			object_id=object_id,
 		)
-		try:
-			queryset[0]
-		except IndexError:
-			Comment.objects.get_or_create_root_comment(ctype, object_id)
-			queryset = Comment.objects.filter(
-				content_type=ctype,
-				object_id=object_id,
-			)
-		queryset = queryset.select_related('user__rating')
+
+	def get_queryset(self):
+		queryset = self.get_base_queryset()
 		queryset = queryset.prefetch_related('attachments')
 		queryset = queryset.annotate(attachment_count=Count('attachments'))
-		queryset = queryset.defer(
-			"original_comment",
-			"user__rating__comments", "user__rating__articles", "user__rating__helped", "user__rating__news", "user__rating__wiki",
-			"user__password", "user__filtered_info",
-		)
+		queryset = queryset.defer("original_comment")
 		queryset = queryset.order_by('lft')
 
 		return queryset
 
-	def get_discussion_attribute(self):
-		object_id = self.target.pk
-		ctype = self.target_ctype
-		header = RootHeader.objects.get(content_type=ctype, object_id=object_id)
-		discussion_attribute = UserDiscussionAttribute.objects.get_or_create(user=self.context['user'], discussion=header)[0]
-		return discussion_attribute
-
-	def highlight_new(self, query_set):
-		root_item = query_set.root_item
+	def get_comments(self, window=None):
+		"""
+		Vráti zoznam komentárov nezávislý na používateľovi a číslo ďalšieho
+		okna. Výsledok je uložený v cache a invaliduje sa pri zmene komentára
+		v diskusii.
+		"""
+		if not self.target.pk:
+			return [], None
+		tag = get_discussion_cache_tag(self.target_ctype.pk, self.target.pk)
+		if window is None:
+			cache_name = cache_instance.make_key('comments.discussion', tag)
+			load = lambda: (self.load_comments(), None)
+		else:
+			cache_name = cache_instance.make_key('comments.discussion.window.%d' % window, tag)
+			load = lambda: self.load_window(window)
+		return get_or_recompute(cache_instance, cache_name, load, tag=tag, max_age=DISCUSSION_CACHE_MAX_AGE)
+
+	def load_comments(self):
+		comments = list(self.get_queryset())
+		if not comments:
+			Comment.objects.get_or_create_root_comment(self.target_ctype, self.target.pk)
+			comments = list(self.get_queryset())
+		return comments
+
+	def load_window(self, window):
+		"""
+		Načíta koreň diskusie a `COMMENTS_WINDOW_SIZE` vlákien začínajúcich
+		od okna `window`. Vlákna sa vyberajú podľa rozsahu `lft` v MPTT strome.
+		"""
+		offset = window * COMMENTS_WINDOW_SIZE
+		threads = list(self.get_base_queryset()
+			.filter(level=1)
+			.order_by('lft')
+			.values_list('tree_id', 'lft', 'rght')[offset:offset+COMMENTS_WINDOW_SIZE+1])
+		if not threads:
+			if window == 0:
+				return self.load_comments(), None
+			return list(self.get_queryset().filter(level=0)), None
+		next_window = window + 1 if len(threads) > COMMENTS_WINDOW_SIZE else None
+		threads = threads[:COMMENTS_WINDOW_SIZE]
+		tree_id = threads[0][0]
+		window_filter = Q(level=0) | Q(tree_id=tree_id, lft__gte=threads[0][1], rght__lte=threads[-1][2])
+		return list(self.get_queryset().filter(window_filter)), next_window
+
+	def attach_users(self, comments):
+		"""
+		Autori komentárov (meno, podpis, hodnotenie) sa menia nezávisle od
+		diskusie, preto nie sú uložení v cache so zoznamom komentárov
+		a načítavajú sa pri každej požiadavke jedným dotazom.
+		"""
+		user_ids = set(comment.user_id for comment in comments if comment.user_id)
+		if not user_ids:
+			return
+		users = (get_user_model().objects
+			.filter(pk__in=user_ids)
+			.select_related('rating')
+			.defer('password', 'filtered_info'))
+		users = {user.pk: user for user in users}
+		user_field = Comment._meta.get_field('user')
+		for comment in comments:
+			if comment.user_id:
+				user_field.set_cached_value(comment, users.get(comment.user_id))
+
+	def get_discussion_attribute(self, header=None):
+		user = self.context['user']
+		if header is None:
+			header = self.get_root_header()
+		return UserDiscussionAttribute.objects.get_or_create(user=user, discussion=header)[0]
+
+	def find_discussion_attribute(self):
+		return (UserDiscussionAttribute.objects
+			.select_related('discussion')
+			.filter(user=self.context['user'], discussion__content_type=self.target_ctype, discussion__object_id=self.target.pk)
+			.first())
+
+	def highlight_new(self, comments):
+		root_item = comments.root_item
 		prev_new_item = root_item
-		for comment in query_set:
+		for comment in comments:
 			if comment.is_new:
 				prev_new_item.next_new = comment.pk
 				if prev_new_item != root_item:
@@ -86,7 +160,7 @@ class DiscussionLoader:
 
 	def update_discussion_attribute(self, discussion_attribute):
 		discussion_attribute.time = timezone.now()
-		discussion_attribute.save()
+		discussion_attribute.save(update_fields=['time'])
 
 	def get_last_display_time(self, discussion_attribute):
 		last_display_time = timezone.now()
@@ -94,28 +168,52 @@ class DiscussionLoader:
 			last_display_time = discussion_attribute.time
 		return last_display_time
 
-	def load(self, context, target):
+	def is_comment_requested(self):
+		# odkaz na konkrétny komentár (#link_<id>) musí nájsť komentár na stránke
+		request = self.context.get('request')
+		return request is not None and COMMENT_QUERY_PARAMETER in request.GET
+
+	def load(self, context, target, window=None, last_display_time=None):
+		"""
+		Načíta diskusiu. Ak je `window` None, ide o prvé zobrazenie diskusie,
+		ktoré aktualizuje čas zobrazenia pre používateľa. Ďalšie okná
+		zvýrazňujú nové komentáre podľa `last_display_time` prvého zobrazenia.
+		"""
 		self.target = target
 		self.context = context
+		is_authenticated = 'user' in context and context['user'].is_authenticated
+		is_first_display = window is None
 		attrib = None
-		query_set = self.get_queryset()
-		if 'user' in context and context['user'].is_authenticated:
-			attrib = self.get_discussion_attribute()
-			last_display_time = self.get_last_display_time(attrib)
-			self.update_discussion_attribute(attrib)
-			query_set = query_set.annotate(is_new=Case(
-				When(created__gte=last_display_time, then=True),
-				default=False,
-				output_field=BooleanField()
-			))
-			setattr(query_set, 'root_item', query_set.get(level=0))
-			self.highlight_new(query_set)
+		if is_authenticated:
+			attrib = self.find_discussion_attribute()
+			header = attrib.discussion if attrib is not None else None
 		else:
-			setattr(query_set, 'root_item', query_set.get(level=0))
-		setattr(query_set, 'root_header', self.root_header)
-		if 'user' in context and context['user'].is_authenticated:
-			setattr(query_set, 'user_attribute', attrib)
-		return query_set
+			header = self.find_root_header()
+		if window is None and header is not None and header.comment_count > COMMENTS_WINDOW_THRESHOLD and not self.is_comment_requested():
+			window = 0
+
+		comments, next_window = self.get_comments(window)
+		comments = DiscussionComments(comments)
+		self.attach_users(comments)
+		comments.window = window
+		comments.next_window = next_window
+		comments.root_item = next((comment for comment in comments if comment.level == 0), None)
+		if header is None:
+			header = self.get_root_header()
+		comments.root_header = header
+		if is_authenticated:
+			if attrib is None:
+				attrib = self.get_discussion_attribute(header)
+			if last_display_time is None:
+				last_display_time = self.get_last_display_time(attrib)
+			if is_first_display:
+				self.update_discussion_attribute(attrib)
+			for comment in comments:
+				comment.is_new = comment.created >= last_display_time
+			self.highlight_new(comments)
+			comments.user_attribute = attrib
+			comments.last_display_time = last_display_time
+		return comments
 
 
 def load_user_discussion_attributes(headers, user):
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.contenttypes.models import ContentType
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Comment, RootHeader, UserDiscussionAttribute
+from .search_indexes import CommentIndex
+from .templatetags.comments_tags import DiscussionLoader
+from .utils import COMMENT_QUERY_PARAMETER, get_comment_link
+from accounts.models import UserRating
+from article.models import Article, Category
+from common_utils.cache import cache_instance
+from common_utils.tasks import DatabaseBackend
+from linuxos.cron_tasks import reconcile_comments_headers
+from rich_editor.widgets import TextVal
+
+
+class CommentsTestMixin(object):
+	def setUp(self):
+		self.category = Category.objects.create(name='category', slug='category')
+		self.article = Article.objects.create(title='test', slug='test', category=self.category)
+		self.content_type = ContentType.objects.get_for_model(Article)
+		self.root = Comment.objects.get_or_create_root_comment(self.content_type, self.article.pk)[0]
+		cache_instance.cache.clear()
+
+	def create_comment(self, parent=None, **kwargs):
+		defaults = {
+			'parent': parent or self.root,
+			'content_type': self.content_type,
+			'object_id': self.article.pk,
+			'subject': 'subject',
+			'user_name': 'user',
+			'original_comment': TextVal('html:<p>text</p>'),
+		}
+		defaults.update(kwargs)
+		return Comment.objects.create(**defaults)
+
+	def get_header(self):
+		return RootHeader.objects.get(content_type=self.content_type, object_id=self.article.pk)
+
+
+class CommentsHeaderTest(CommentsTestMixin, TestCase):
+	def test_increment(self):
+		comment = self.create_comment()
+		header = self.get_header()
+		self.assertEqual(header.comment_count, 1)
+		self.assertEqual(header.last_comment, comment.created)
+
+		older = self.create_comment(parent=comment, created=comment.created - timedelta(1))
+		header = self.get_header()
+		self.assertEqual(header.comment_count, 2)
+		self.assertEqual(header.last_comment, comment.created)
+
+	def test_hidden_comment(self):
+		self.create_comment()
+		self.create_comment(is_public=False)
+		self.assertEqual(self.get_header().comment_count, 1)
+
+	def test_deferred_header(self):
+		with mock.patch('common_utils.tasks.DEFERRED_TASKS_BACKEND', 'database'), mock.patch('common_utils.tasks.backend', DatabaseBackend()):
+			article = Article.objects.create(title='deferred', slug='deferred', category=self.category)
+			comments = DiscussionLoader().load({'user': AnonymousUser()}, article)
+			self.assertEqual(comments.root_header.comment_count, 0)
+			self.assertEqual(comments.root_header.last_comment, article.created)
+			user = get_user_model().objects.create_user(username='test', email='test@test.tld')
+			comments = DiscussionLoader().load({'user': user}, article)
+			self.assertEqual(comments.user_attribute.discussion, comments.root_header)
+
+	def test_reconcile(self):
+		comment = self.create_comment()
+		RootHeader.objects.update(comment_count=10, last_comment=timezone.now() - timedelta(10))
+		reconcile_comments_headers()
+		header = self.get_header()
+		self.assertEqual(header.comment_count, 1)
+		self.assertEqual(header.last_comment, comment.created)
+
+	def test_reconcile_empty(self):
+		comment = self.create_comment()
+		Comment.objects.filter(pk=comment.pk).update(is_public=False)
+		RootHeader.objects.update(last_comment=timezone.now())
+		reconcile_comments_headers()
+		header = self.get_header()
+		self.assertEqual(header.comment_count, 0)
+		self.assertEqual(header.last_comment, self.article.created)
+
+
+class DiscussionLoaderTest(CommentsTestMixin, TestCase):
+	def load(self):
+		return DiscussionLoader().load({'user': AnonymousUser()}, self.article)
+
+	def test_cached_comments(self):
+		comment = self.create_comment()
+		comments = self.load()
+		self.assertEqual([c.pk for c in comments], [self.root.pk, comment.pk])
+		self.assertEqual(comments.root_item.pk, self.root.pk)
+
+	def test_query_count(self):
+		self.create_comment()
+		self.create_comment()
+		cache_instance.cache.clear()
+		with self.assertNumQueries(3): # comments, attachments, root header
+			self.load()
+		with self.assertNumQueries(1): # root header
+			self.load()
+
+	def test_query_count_authenticated(self):
+		user = get_user_model().objects.create_user(username='test', email='test@test.tld')
+		self.create_comment()
+		loader = DiscussionLoader()
+		comments = loader.load({'user': user}, self.article)
+		self.assertEqual(comments.root_header, self.get_header())
+		self.assertEqual(comments.user_attribute.user, user)
+		with self.assertNumQueries(2): # discussion attribute with header, update time
+			comments = DiscussionLoader().load({'user': user}, self.article)
+		self.assertEqual(comments.root_header, self.get_header())
+
+	def test_user_rating_not_cached(self):
+		user = get_user_model().objects.create_user(username='rated', email='rated@test.tld')
+		self.create_comment(user=user)
+		self.load()
+		UserRating.objects.update_or_create(user=user, defaults={'rating': 500})
+		comments = self.load()
+		self.assertEqual(comments[1].user.rating.rating, 500)
+
+	def test_user_not_cached(self):
+		user = get_user_model().objects.create_user(username='author', email='author@test.tld')
+		self.create_comment(user=user)
+		self.load()
+		get_user_model().objects.filter(pk=user.pk).update(username='renamed')
+		with self.assertNumQueries(2): # root header, users with rating
+			comments = self.load()
+		self.assertEqual(comments[1].user.username, 'renamed')
+
+	def test_create_root(self):
+		Comment.objects.all().delete()
+		cache_instance.cache.clear()
+		comments = self.load()
+		self.assertEqual(len(comments), 1)
+		self.assertEqual(comments.root_item.level, 0)
+
+	def test_invalidate(self):
+		self.load()
+		comment = self.create_comment()
+		self.assertEqual([c.pk for c in self.load()], [self.root.pk, comment.pk])
+		comment.delete()
+		self.assertEqual([c.pk for c in self.load()], [self.root.pk])
+
+
+@mock.patch('comments.templatetags.comments_tags.COMMENTS_WINDOW_SIZE', 2)
+class DiscussionWindowTest(CommentsTestMixin, TestCase):
+	def setUp(self):
+		super(DiscussionWindowTest, self).setUp()
+		self.threads = []
+		for __ in range(5):
+			thread = self.create_comment()
+			self.threads.append([thread, self.create_comment(parent=thread)])
+
+	def load(self, window):
+		return DiscussionLoader().load({'user': AnonymousUser()}, self.article, window=window)
+
+	def test_windows(self):
+		comments = self.load(0)
+		self.assertEqual([c.pk for c in comments], [self.root.pk] + [c.pk for c in self.threads[0] + self.threads[1]])
+		self.assertEqual(comments.next_window, 1)
+
+		comments = self.load(2)
+		self.assertEqual([c.pk for c in comments], [self.root.pk] + [c.pk for c in self.threads[4]])
+		self.assertIsNone(comments.next_window)
+
+	@mock.patch('comments.templatetags.comments_tags.COMMENTS_WINDOW_THRESHOLD', 5)
+	def test_threshold(self):
+		comments = DiscussionLoader().load({'user': AnonymousUser()}, self.article)
+		self.assertEqual(comments.window, 0)
+		self.assertEqual(len(comments), 5)
+
+	def test_window_view(self):
+		response = self.client.get(reverse('comments:comments-window', args=(self.get_header().pk, 1)))
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.context_data['comments'].next_window, 2)
+
+	def test_window_keeps_display_time(self):
+		user = get_user_model().objects.create_user(username='test', email='test@test.tld')
+		comments = DiscussionLoader().load({'user': user}, self.article, window=0)
+		attribute_time = comments.user_attribute.time
+		last_display_time = timezone.now() - timedelta(1)
+		comments = DiscussionLoader().load({'user': user}, self.article, window=1, last_display_time=last_display_time)
+		self.assertEqual(comments.last_display_time, last_display_time)
+		self.assertTrue(all(comment.is_new for comment in comments[1:]))
+		self.assertEqual(UserDiscussionAttribute.objects.get(pk=comments.user_attribute.pk).time, attribute_time)
+
+	@mock.patch('comments.templatetags.comments_tags.COMMENTS_WINDOW_THRESHOLD', 5)
+	def test_requested_comment(self):
+		request = RequestFactory().get('/', {COMMENT_QUERY_PARAMETER: self.threads[4][1].pk})
+		comments = DiscussionLoader().load({'user': AnonymousUser(), 'request': request}, self.article)
+		self.assertIsNone(comments.window)
+		self.assertIn(self.threads[4][1].pk, [c.pk for c in comments])
+
+	def test_comment_link(self):
+		self.assertEqual(get_comment_link('/clanok/', 3), '/clanok/?comment=3#link_3')
+		self.assertEqual(get_comment_link('/clanok/?page=2', 3), '/clanok/?page=2&comment=3#link_3')
+
+
+class CommentFieldTrackingTest(CommentsTestMixin, TestCase):
+	def test_changed(self):
+		comment = Comment.objects.get(pk=self.create_comment().pk)
+		self.assertFalse(Comment._meta.get_field('original_comment').has_changed(comment))
+		comment.original_comment = TextVal('html:<p>new</p>')
+		self.assertEqual(comment.comment, '<p>new</p>')
+		comment.save()
+		self.assertEqual(Comment.objects.get(pk=comment.pk).filtered_comment, '<p>new</p>')
+
+	def test_unchanged(self):
+		comment = Comment.objects.get(pk=self.create_comment().pk)
+		with mock.patch('rich_editor.fields.RichTextOriginalField.filter_data') as filter_data:
+			comment.save()
+			filter_data.assert_not_called()
+
+	def test_load_tracking(self):
+		comment = self.create_comment()
+		field_names = [field.attname for field in Comment._meta.concrete_fields]
+		values = Comment.objects.filter(pk=comment.pk).values_list(*field_names).get()
+		instance = Comment.from_db('default', field_names, values)
+		self.assertNotIn(Comment._meta.get_field('original_comment').original_attribute, instance.__dict__)
+		self.assertFalse(hasattr(instance, 'old_values'))
+
+
+class CommentIndexTest(CommentsTestMixin, TestCase):
+	def test_prefetch_content_objects(self):
+		for i in range(5):
+			article = Article.objects.create(title='test %d' % i, slug='test-%d' % i, category=self.category, authors_name='autor %d' % i)
+			RootHeader.objects.create(content_type=self.content_type, object_id=article.pk, pub_date=timezone.now(), last_comment=timezone.now())
+		index = CommentIndex()
+		with self.assertNumQueries(2):
+			headers = list(index.index_queryset())
+			titles = [index.prepare_title(header) for header in headers]
+			authors = [index.prepare_author(header) for header in headers]
+		self.assertEqual(len(headers), RootHeader.objects.count())
+		self.assertIn('test 4', titles)
+		self.assertIn('autor 4', authors)
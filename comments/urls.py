@@ -15,6 +15,7 @@ urlpatterns = [
 	path('zabudnut/<int:pk>/', views.Forget.as_view(), name='forget'),
 	path('pocet/<int:ctype>/<int:pk>/', views.CommentCountImage.as_view(), name='count-image'),
 	path('<int:pk>/', views.Comments.as_view(), name='comments'),
+	path('<int:pk>/okno/<int:window>/', views.CommentsWindow.as_view(), name='comments-window'),
 	path('zobrazit/<int:pk>/', views.CommentDetailSingle.as_view(), name='comment-single'),
 	path('id/<int:pk>/', views.CommentDetail.as_view(), name='comment'),
 	path('feeds/latest/', feeds.CommentFeed(), name='feed-latest'),
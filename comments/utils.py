@@ -1,11 +1,30 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from django.conf import settings
 from django.db import transaction
-from django.db.models import Count, Max
+from django.db.models import Count, Max, F, Value, DateTimeField
+from django.db.models.functions import Greatest
 
 from . import signals
 from .models import CommentFlag, RootHeader, Comment
+from common_utils.cache import cache_instance, invalidate_model_cache
+
+
+DISCUSSION_CACHE_MAX_AGE = getattr(settings, 'COMMENTS_DISCUSSION_CACHE_MAX_AGE', 3600)
+COMMENTS_WINDOW_SIZE = getattr(settings, 'COMMENTS_WINDOW_SIZE', 50)
+COMMENTS_WINDOW_THRESHOLD = getattr(settings, 'COMMENTS_WINDOW_THRESHOLD', 500)
+# parameter v URL, s ktorým sa diskusia zobrazí celá (nie po oknách)
+COMMENT_QUERY_PARAMETER = 'comment'
+
+
+def get_comment_link(url, comment_id):
+	"""
+	Odkaz na komentár v diskusii `url`. Diskusia sa nerozdelí na okná, aby
+	bol komentár na stránke.
+	"""
+	separator = '&' if '?' in url else '?'
+	return '%s%s%s=%d#link_%d' % (url, separator, COMMENT_QUERY_PARAMETER, comment_id, comment_id)
 
 
 def perform_flag_action(request, comment, comment_flag, action=None):
@@ -44,6 +63,41 @@ def perform_approve(request, comment):
 	perform_flag_action(request, comment, CommentFlag.MODERATOR_APPROVAL, action)
 
 
+def increment_comments_header(comment):
+	"""
+	Pripočíta nový verejný komentár k hlavičke diskusie bez prepočítania
+	štatistík celej diskusie. Vráti False, ak hlavička ešte neexistuje.
+	"""
+	updated = (RootHeader.objects
+		.filter(content_type_id=comment.content_type_id, object_id=comment.object_id)
+		.update(
+			comment_count=F('comment_count') + 1,
+			last_comment=Greatest(F('last_comment'), Value(comment.created, output_field=DateTimeField()))
+		))
+	if updated:
+		invalidate_model_cache(RootHeader)
+	return bool(updated)
+
+
+def get_or_create_root_header(root):
+	"""
+	Vráti hlavičku diskusie koreňového komentára, chýbajúcu hlavičku hneď
+	vytvorí. Počet komentárov a čas posledného komentára aktualizuje
+	odložená úloha.
+	"""
+	header = RootHeader.objects.filter(content_type_id=root.content_type_id, object_id=root.object_id).first()
+	if header is not None:
+		return header, False
+	content_object = root.content_object
+	last_comment = getattr(content_object, 'created', None) or root.created
+	with transaction.atomic():
+		return RootHeader.objects.get_or_create(
+			content_type_id=root.content_type_id,
+			object_id=root.object_id,
+			defaults={'pub_date': root.created, 'last_comment': last_comment, 'is_locked': root.is_locked}
+		)
+
+
 def update_comments_header(sender, instance, **kwargs): #pylint: disable=unused-argument
 	try:
 		if instance.parent is None:
@@ -77,3 +131,11 @@ def update_comments_header(sender, instance, **kwargs): #pylint: disable=unused-
 		header.comment_count = statistics['pk__count']
 		header.save()
 		return header
+
+
+def get_discussion_cache_tag(content_type_id, object_id):
+	return 'comments.discussion.%d.%d' % (content_type_id, object_id)
+
+
+def invalidate_discussion_cache(content_type_id, object_id):
+	cache_instance.delete_tag(get_discussion_cache_tag(content_type_id, object_id))
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from datetime import datetime
+
 from braces.views import PermissionRequiredMixin, LoginRequiredMixin
 from django import http
 from django.contrib.contenttypes.models import ContentType
@@ -9,15 +11,16 @@ from django.shortcuts import get_object_or_404
 from django.template.defaultfilters import capfirst
 from django.template.response import TemplateResponse
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.translation import ungettext
 from django.views.generic import DetailView, View
 from django.views.generic.edit import FormView
 
 from .forms import CommentForm
 from .models import Comment
-from .utils import update_comments_header
+from .utils import update_comments_header, invalidate_discussion_cache, get_comment_link
 from comments.models import RootHeader, UserDiscussionAttribute
-from comments.templatetags.comments_tags import add_discussion_attributes
+from comments.templatetags.comments_tags import DiscussionLoader, add_discussion_attributes
 from common_utils import get_meta
 
 
@@ -93,7 +96,7 @@ class Reply(FormView):
 		comment.save()
 		form.move_attachments(comment)
 
-		return http.HttpResponseRedirect(self.request.POST.get('next', '') + '#link_' + str(comment.pk))
+		return http.HttpResponseRedirect(get_comment_link(self.request.POST.get('next', ''), comment.pk))
 
 
 class Admin(PermissionRequiredMixin, DetailView):
@@ -118,10 +121,11 @@ class Admin(PermissionRequiredMixin, DetailView):
 			comment.save()
 		if lock is not None:
 			comment.get_descendants(include_self=True).update(is_locked=bool(lock))
+			invalidate_discussion_cache(comment.content_type_id, comment.object_id)
 
 		comment = Comment.objects.get(pk=comment.pk)
 		update_comments_header(Comment, instance=comment)
-		return HttpResponseRedirect(comment.content_object.get_absolute_url() + '#link_' + str(comment.pk))
+		return HttpResponseRedirect(get_comment_link(comment.content_object.get_absolute_url(), comment.pk))
 
 
 class Watch(LoginRequiredMixin, DetailView):
@@ -175,6 +179,30 @@ class Comments(DetailView):
 		return ctx
 
 
+class CommentsWindow(DetailView):
+	model = RootHeader
+	template_name = 'comments/comments_window.html'
+
+	def get_last_display_time(self):
+		try:
+			return datetime.fromtimestamp(float(self.request.GET['time']), timezone.utc)
+		except (KeyError, ValueError, OverflowError, OSError):
+			return None
+
+	def get_context_data(self, **kwargs):
+		ctx = super(CommentsWindow, self).get_context_data(**kwargs)
+		obj = ctx['object'].content_object
+		if obj is None:
+			raise http.Http404()
+		comments = DiscussionLoader().load({'user': self.request.user}, obj, window=self.kwargs['window'], last_display_time=self.get_last_display_time())
+		ctx.update({
+			'object': obj,
+			'root_header': ctx['object'],
+			'comments': comments,
+		})
+		return ctx
+
+
 class CommentDetail(DetailView):
 	model = Comment
 	template_name = 'comments/comments.html'
@@ -4,6 +4,7 @@ from __future__ import unicode_literals
 import os
 
 import inspect
+from collections import deque
 
 from web.middlewares.threadlocal import get_current_request
 
@@ -56,3 +57,18 @@ def get_default_manager(obj):
 
 def get_client_ip(request):
 	return request.META.get('REMOTE_ADDR')
+
+
+def imap_in_order(pool, fun, iterable, window):
+	"""
+	Ako `Pool.imap`, ale prvky `iterable` sa čítajú v hlavnom vlákne (nie vo
+	vlákne poolu, ktoré by otvorilo vlastné, nikdy nezatvorené spojenie do
+	databázy). Naraz sa spracúva najviac `window` prvkov.
+	"""
+	pending = deque()
+	for item in iterable:
+		pending.append(pool.apply_async(fun, (item,)))
+		if len(pending) >= window:
+			yield pending.popleft().get()
+	while pending:
+		yield pending.popleft().get()
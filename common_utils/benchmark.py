@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Meranie rýchlosti generovania kľúčov cache.
+
+Spustenie::
+
+	DJANGO_SETTINGS_MODULE=web.settings python -m common_utils.benchmark --iterations 10000
+"""
+from __future__ import unicode_literals
+
+import argparse
+import sys
+import timeit
+
+
+def run_benchmarks(iterations):
+	from article.models import Category
+	from .cache import default_key_builder, pickle_key_builder
+
+	args = (Category(pk=1, name='category', slug='category'), 1, 'text', (2, 3))
+	kwargs = {'page': 1}
+	return [
+		(name, timeit.timeit(lambda: key_builder(args, kwargs), number=iterations) / iterations)
+		for name, key_builder in (('default', default_key_builder), ('pickle', pickle_key_builder))
+	]
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Benchmark cache key builders')
+	parser.add_argument('--iterations', type=int, default=10000)
+	args = parser.parse_args(argv)
+
+	import django
+	django.setup()
+
+	for name, seconds in run_benchmarks(args.iterations):
+		print('%s key builder: %.2fus per call' % (name, seconds * 1e6))
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
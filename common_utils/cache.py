@@ -1,53 +1,31 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-import collections
 import hashlib
 import pickle
+import time
 from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db.models import Model
 from django.db.models.signals import post_delete, post_save
+from django.utils import six
+from django.utils.encoding import force_text
 
 from common_utils import get_meta
-default_cache = caches['default']
-
-
-class LRUCache(collections.MutableMapping):
-	def __init__(self, maxsize):
-		self.__maxsize = maxsize
-		self.__cache = collections.OrderedDict()
-
-	def __getitem__(self, key):
-		value = self.__cache.pop(key)
-		self.__cache[key] = value
-		return value
-
-	def __setitem__(self, key, value):
-		self.__cache.pop(key, None)
-		self.__cache[key] = value
-		if len(self.__cache) > self.__maxsize:
-			self.__cache.popitem(last=False)
 
-	def __delitem__(self, key):
-		self.__cache.pop(key)
-
-	def __contains__(self, key):
-		return key in self.__cache
-
-	def __iter__(self):
-		return iter(self.__cache)
+default_cache = caches['default']
 
-	def __len__(self):
-		return len(self.__cache)
 
-	def __repr__(self):
-		return repr(self.__cache)
+class Cache(object):
+	CACHE_MAX_AGE = 60
 
-	def get(self, key, default=None):
-		return self.__cache.get(key, default)
+	def make_key(self, name, tag=None):
+		return name
 
+	def set(self, name, value, tag=None, max_age=None):
+		raise NotImplementedError()
 
-class Cache(object):
-	def set(self, name, value, tag=None):
+	def add(self, name, value, max_age=None):
 		raise NotImplementedError()
 
 	def get(self, name):
@@ -68,12 +46,18 @@ class SimpleCache(Cache):
 		self.__data = {}
 		self.__data['__tags__'] = {}
 
-	def set(self, name, value, tag=None):
+	def set(self, name, value, tag=None, max_age=None):
 		self.__data[name] = value
 		if tag is not None:
 			self.__data['__tags__'].setdefault(tag, [])
 			self.__data['__tags__'][tag].append(name)
 
+	def add(self, name, value, max_age=None):
+		if name in self.__data:
+			return False
+		self.__data[name] = value
+		return True
+
 	def get(self, name):
 		return self.__data[name]
 
@@ -93,17 +77,43 @@ class SimpleCache(Cache):
 
 
 class DjangoCache(Cache):
-	CACHE_MAX_AGE = 60
+	"""
+	Cache so zdieľanou invalidáciou podľa tagov.
+
+	Každý tag má v cache uložené číslo verzie, ktoré je súčasťou kľúča
+	(`make_key`). Zmazanie tagu iba zvýši verziu, staré záznamy sa už
+	nenačítajú a vypršia samé. Invalidácia tak funguje medzi procesmi aj
+	servermi.
+	"""
+
+	TAG_PREFIX = 'cache_tag:'
 
 	def __init__(self):
 		self.cache = caches['default']
-		self.tags = {}
 
-	def set(self, name, value, tag=None):
-		self.cache.set(name, value, self.CACHE_MAX_AGE)
-		if tag is not None:
-			self.tags.setdefault(tag, [])
-			self.tags[tag].append(name)
+	def new_tag_version(self):
+		# verzia po vypadnutí z cache nesmie začínať znovu od rovnakého čísla
+		return int(time.time() * 1000)
+
+	def get_tag_version(self, tag):
+		key = self.TAG_PREFIX + tag
+		version = self.cache.get(key)
+		if version is None:
+			version = self.new_tag_version()
+			if not self.cache.add(key, version, None):
+				version = self.cache.get(key, version)
+		return version
+
+	def make_key(self, name, tag=None):
+		if tag is None:
+			return name
+		return '%s:%s:%d' % (name, tag, self.get_tag_version(tag))
+
+	def set(self, name, value, tag=None, max_age=None):
+		self.cache.set(name, value, max_age or self.CACHE_MAX_AGE)
+
+	def add(self, name, value, max_age=None):
+		return self.cache.add(name, value, max_age or self.CACHE_MAX_AGE)
 
 	def get(self, name):
 		val = self.cache.get(name)
@@ -113,90 +123,257 @@ class DjangoCache(Cache):
 
 	def delete(self, name):
 		self.cache.delete(name)
-		for lst in self.tags.values():
-			if name in lst:
-				lst.remove(name)
 
 	def delete_tag(self, tag):
-		tags = self.tags
-		if not tag in tags:
-			return
-		for name in tags[tag]:
-			self.cache.delete(name)
-		self.tags[tag] = []
+		key = self.TAG_PREFIX + tag
+		try:
+			self.cache.incr(key)
+		except ValueError:
+			self.cache.add(key, self.new_tag_version(), None)
+
+
+RECOMPUTE_LOCK_TIMEOUT = 30
+
+
+def get_or_recompute(cache, cache_name, compute, tag=None, max_age=None, stale_age=None):
+	"""
+	Načíta hodnotu z cache, alebo ju vypočíta.
+
+	Ak je nastavené `stale_age`, záznam sa po `max_age` iba označí ako
+	zastaraný a ešte `stale_age` sekúnd zostáva v cache. Prepočet spustí iba
+	proces, ktorý získa zámok (`add`), ostatné zatiaľ vracajú starú hodnotu.
+	"""
+	if stale_age is None:
+		try:
+			return cache.get(cache_name)
+		except KeyError:
+			ret = compute()
+			cache.set(cache_name, ret, tag=tag, max_age=max_age)
+			return ret
+
+	max_age = max_age or cache.CACHE_MAX_AGE
+	now = time.time()
+	try:
+		soft_expires, ret = cache.get(cache_name)
+	except KeyError:
+		soft_expires = None
+	else:
+		if now < soft_expires:
+			return ret
+
+	lock_name = cache_name + ':lock'
+	locked = cache.add(lock_name, True, max_age=RECOMPUTE_LOCK_TIMEOUT)
+	if not locked and soft_expires is not None:
+		return ret
+
+	try:
+		ret = compute()
+		cache.set(cache_name, (now + max_age, ret), tag=tag, max_age=max_age + stale_age)
+	finally:
+		if locked:
+			cache.delete(lock_name)
+	return ret
+
+
+KEY_PRIMITIVE_TYPES = frozenset((type(None), bool, float, six.text_type, six.binary_type) + six.integer_types)
+
 
+class TaggedKeyValue(tuple):
+	"""
+	Hodnota kľúča označená typom (dict, model, pickle). Reprezentácia začína
+	názvom typu, takže sa nezhoduje s reprezentáciou žiadneho tuple alebo
+	primitívnej hodnoty.
+	"""
+	__slots__ = ()
 
-def cached_fn_raw(fun, cache, tag=None, name=None, is_method=False):
+	def __repr__(self):
+		return self[0] + tuple.__repr__(self[1:])
+
+
+def sort_key_item(item):
+	# kľúče slovníka môžu mať rôzne typy, ktoré nie je možné porovnať
+	return (type(item[0]).__name__, repr(item[0]))
+
+
+def normalize_key_value(value):
+	"""
+	Prevedie argument funkcie na hodnotu so stabilnou reprezentáciou.
+
+	Modely sa nahradia názvom modelu a primárnym kľúčom, slovníky usporiadaným
+	zoznamom dvojíc, ostatné neznáme typy sa serializujú cez pickle.
+	"""
+	value_type = type(value)
+	if value_type in KEY_PRIMITIVE_TYPES:
+		return value
+	if value_type is tuple:
+		for item in value:
+			if type(item) not in KEY_PRIMITIVE_TYPES:
+				return tuple([normalize_key_value(item) for item in value])
+		return value
+	if value_type is list:
+		return [normalize_key_value(item) for item in value]
+	if value_type is dict:
+		items = [(normalize_key_value(key), normalize_key_value(item)) for key, item in value.items()]
+		items.sort(key=sort_key_item)
+		return TaggedKeyValue(['dict'] + items)
+	if isinstance(value, Model):
+		return TaggedKeyValue(('model', get_meta(value).label_lower, value.pk))
+	return TaggedKeyValue(('pickle', hashlib.sha1(pickle.dumps(value)).hexdigest()))
+
+
+def default_key_builder(args, kwargs):
+	key = repr(normalize_key_value(args))
+	if kwargs:
+		key += repr(normalize_key_value(kwargs))
+	return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def pickle_key_builder(args, kwargs):
+	return hashlib.sha1(pickle.dumps(args) + pickle.dumps(kwargs)).hexdigest()
+
+
+def cached_fn_raw(fun, cache, tag=None, name=None, is_method=False, max_age=None, stale_age=None, key_builder=default_key_builder):
 	def wrap(*args, **kwargs):
 		cache_name = name or fun.__module__ + '.' + fun.__name__
 		fn_args = args
 		if is_method:
 			fn_args = args[1:]
 		if fn_args or kwargs:
-			cache_name += hashlib.sha1(pickle.dumps(fn_args) + pickle.dumps(kwargs)).hexdigest()
-		try:
-			return cache.get(cache_name)
-		except KeyError:
-			ret = fun(*args, **kwargs)
-			cache.set(cache_name, ret, tag=tag)
-			return ret
+			cache_name += key_builder(fn_args, kwargs)
+		cache_name = cache.make_key(cache_name, tag)
+		return get_or_recompute(cache, cache_name, lambda: fun(*args, **kwargs), tag=tag, max_age=max_age, stale_age=stale_age)
 	return wrap
 
 
 def cached_fn_factory(cache):
-	def decorator(tag=None, name=None):
+	def decorator(tag=None, name=None, max_age=None, stale_age=None, models=None, key_builder=default_key_builder):
+		if tag is not None:
+			register_tag(cache, tag, models)
 		def cached_fn_wrap(fun):
-			return cached_fn_raw(fun, cache, tag=tag, name=name)
+			return cached_fn_raw(fun, cache, tag=tag, name=name, max_age=max_age, stale_age=stale_age, key_builder=key_builder)
 		return cached_fn_wrap
 	return decorator
 
 
 def cached_method_factory(cache):
-	def decorator(tag=None, name=None):
+	def decorator(tag=None, name=None, max_age=None, stale_age=None, models=None, key_builder=default_key_builder):
+		if tag is not None:
+			register_tag(cache, tag, models)
 		def cached_fn_wrap(fun):
-			return cached_fn_raw(fun, cache, tag=tag, name=name, is_method=True)
+			return cached_fn_raw(fun, cache, tag=tag, name=name, is_method=True, max_age=max_age, stale_age=stale_age, key_builder=key_builder)
 		return cached_fn_wrap
 	return decorator
 
 
-cache_instance = DjangoCache()
-cached_fn = cached_fn_factory(cache_instance)
-cached_method = cached_method_factory(cache_instance)
+INVALIDATION_STATS_PREFIX = 'cache_tag_invalidations:'
+registered_tags = {}
 
 
-def delete_model_cache(sender, **kwargs):
-	meta = get_meta(sender)
-	tag_name = '%s.%s' % (meta.app_label, meta.model_name)
-	cache_instance.delete_tag(tag_name)
-	if tag_name == 'comments.rootheader':
-		cache_instance.delete_tag('forum.topic')
+def register_tag(cache, tag, models=None):
+	"""
+	Zaregistruje invalidáciu tagu pri uložení / zmazaní modelov v `models`.
 
+	Modely sa zadávajú v tvare `app_label.model_name`. Ak nie sú zadané,
+	použije sa názov tagu. Signály sa pripájajú iba pre zaregistrované modely,
+	ostatné uloženia invalidáciu vôbec nespúšťajú.
+	"""
+	models = tuple(models or (tag,))
+	for model in models:
+		if (tag, model) in registered_tags.get(cache, set()):
+			continue
+		registered_tags.setdefault(cache, set()).add((tag, model))
+		receiver = TagInvalidator(cache, tag)
+		dispatch_uid = 'cache_tag:%d:%s:%s' % (id(cache), tag, model)
+		post_save.connect(receiver, sender=model, weak=False, dispatch_uid=dispatch_uid)
+		post_delete.connect(receiver, sender=model, weak=False, dispatch_uid=dispatch_uid)
 
-post_save.connect(delete_model_cache)
-post_delete.connect(delete_model_cache)
+
+class TagInvalidator(object):
+	def __init__(self, cache, tag):
+		self.cache = cache
+		self.tag = tag
+
+	def __call__(self, sender, **kwargs):
+		self.cache.delete_tag(self.tag)
+		try:
+			default_cache.incr(INVALIDATION_STATS_PREFIX + self.tag)
+		except ValueError:
+			default_cache.add(INVALIDATION_STATS_PREFIX + self.tag, 1, None)
+
+
+def invalidate_model_cache(model):
+	"""
+	Invaliduje tagy závislé na modeli. Používa sa pri hromadných zmenách
+	(`QuerySet.update`), ktoré nevolajú signály.
+	"""
+	label = model if isinstance(model, six.string_types) else get_meta(model).label_lower
+	for cache, cache_tags in registered_tags.items():
+		for tag, tag_model in cache_tags:
+			if tag_model == label:
+				TagInvalidator(cache, tag)(model)
+
+
+def get_invalidation_stats():
+	"""
+	Vráti slovník tag -> počet invalidácií (spoločný pre všetky procesy).
+	"""
+	tags = sorted(set(tag for cache_tags in registered_tags.values() for tag, __ in cache_tags))
+	stats = default_cache.get_many([INVALIDATION_STATS_PREFIX + tag for tag in tags])
+	return {tag: stats.get(INVALIDATION_STATS_PREFIX + tag, 0) for tag in tags}
+
+
+def get_registered_models():
+	models = {}
+	for cache_tags in registered_tags.values():
+		for tag, model in cache_tags:
+			models.setdefault(tag, set()).add(model)
+	return models
+
+
+cache_instance = DjangoCache()
+cached_fn = cached_fn_factory(cache_instance)
+cached_method = cached_method_factory(cache_instance)
 
 
 class ObjectCache(object):
-	def __init__(self, cache_name, size=1000):
+	"""
+	Cache objektov uložených pod samostatnými kľúčmi v zdieľanej cache.
+
+	Kľúčom je tuple hodnôt, ktorý sa prevedie na kľúč v tvare
+	`cache_name:hodnota1:hodnota2`. Načítanie a zápis viacerých objektov
+	prebieha jedným volaním `get_many` / `set_many`.
+	"""
+
+	def __init__(self, cache_name, timeout=DEFAULT_TIMEOUT):
 		super(ObjectCache, self).__init__()
 		self.cache_name = cache_name
-		self.size = size
-		self.__cacheobj = None
-
-	@property
-	def cache(self):
-		if self.__cacheobj is None:
-			self.__cacheobj = default_cache.get(self.cache_name)
-			if not self.__cacheobj:
-				self.__cacheobj = LRUCache(self.size)
-		return self.__cacheobj
-
-	def save(self):
-		if self.__cacheobj is None:
+		self.timeout = timeout
+
+	def make_key(self, key):
+		if not isinstance(key, tuple):
+			key = (key,)
+		return ':'.join([self.cache_name] + [force_text(part) for part in key])
+
+	def get(self, key, default=None):
+		return default_cache.get(self.make_key(key), default)
+
+	def get_many(self, keys):
+		cache_keys = {self.make_key(key): key for key in keys}
+		values = default_cache.get_many(list(cache_keys.keys()))
+		return {cache_keys[cache_key]: value for cache_key, value in values.items()}
+
+	def set(self, key, value):
+		default_cache.set(self.make_key(key), value, self.timeout)
+
+	def set_many(self, data):
+		if not data:
 			return
-		default_cache.set(self.cache_name, self.__cacheobj)
-		self.__cacheobj = None
+		default_cache.set_many({self.make_key(key): value for key, value in data.items()}, self.timeout)
+
+	def delete(self, key):
+		default_cache.delete(self.make_key(key))
 
-	def delete(self):
-		default_cache.set(self.cache_name, None)
-		self.save()
+	def delete_many(self, keys):
+		cache_keys = [self.make_key(key) for key in keys]
+		if cache_keys:
+			default_cache.delete_many(cache_keys)
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import namedtuple
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...asciitable import NamedtupleTablePrinter
+from ...cache import get_invalidation_stats, get_registered_models
+
+
+TagStats = namedtuple('TagStats', ['tag', 'models', 'invalidations'])
+
+
+class Command(BaseCommand):
+	help = 'Print cache tag invalidation counters'
+
+	def handle(self, *args, **kwargs):
+		# cached_fn decorators are registered while importing views
+		import_module(settings.ROOT_URLCONF)
+		stats = get_invalidation_stats()
+		models = get_registered_models()
+		rows = [TagStats(tag, ', '.join(sorted(models[tag])), count) for tag, count in sorted(stats.items())]
+		self.stdout.write(NamedtupleTablePrinter(rows, TagStats).render())
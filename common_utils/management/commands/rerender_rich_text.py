@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import multiprocessing
+import os
+import time
+from importlib import import_module
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Case, When, Value, TextField
+
+from ... import imap_in_order
+from ...cache import invalidate_model_cache
+from rich_editor.fields import RichTextOriginalField
+
+
+def get_rich_text_fields(labels=None):
+	fields = []
+	for model in apps.get_models():
+		if labels and model._meta.label_lower not in labels:
+			continue
+		for field in model._meta.local_concrete_fields:
+			if isinstance(field, RichTextOriginalField):
+				fields.append((model, field))
+	return fields
+
+
+def iter_chunks(model, field, last_pk, chunk_size):
+	queryset = model._base_manager.order_by('pk').values_list('pk', field.attname, field.filtered_field)
+	while True:
+		rows = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+		if not rows:
+			return
+		last_pk = rows[-1][0]
+		yield (model._meta.label_lower, field.name, rows)
+
+
+def render_chunk(chunk):
+	model_label, field_name, rows = chunk
+	field = apps.get_model(model_label)._meta.get_field(field_name)
+	changed = []
+	for pk, value, filtered in rows:
+		new_filtered = field.filter_data(value, refresh=True)
+		if new_filtered != filtered:
+			changed.append((pk, new_filtered))
+	return rows[-1][0], len(rows), changed
+
+
+def write_chunk(model, field, changed):
+	if not changed:
+		return
+	filtered = Case(
+		*[When(pk=pk, then=Value(text)) for pk, text in changed],
+		output_field=TextField()
+	)
+	model._base_manager.filter(pk__in=[pk for pk, __ in changed]).update(**{field.filtered_field: filtered})
+
+
+def invalidate_discussions(model, changed, invalidated):
+	"""
+	Zmenené komentáre sú v cache diskusie, ktorú treba zneplatniť.
+	"""
+	from comments.models import Comment
+	from comments.utils import invalidate_discussion_cache
+	if model is not Comment or not changed:
+		return
+	discussions = set(model._base_manager.filter(pk__in=[pk for pk, __ in changed]).values_list('content_type_id', 'object_id'))
+	for content_type_id, object_id in discussions - invalidated:
+		invalidate_discussion_cache(content_type_id, object_id)
+	invalidated.update(discussions)
+
+
+class Command(BaseCommand):
+	help = 'Render filtered content of all rich text fields again'
+
+	def add_arguments(self, parser):
+		parser.add_argument('models', nargs='*', help='Model labels (app_label.model_name), default all models')
+		parser.add_argument('--processes', type=int, default=os.cpu_count(), help='Number of worker processes')
+		parser.add_argument('--chunk-size', type=int, default=500)
+		parser.add_argument('--checkpoint', help='JSON file with last processed primary keys, used to resume interrupted run')
+
+	def load_checkpoint(self, path):
+		if path and os.path.exists(path):
+			with open(path) as fp:
+				return json.load(fp)
+		return {}
+
+	def save_checkpoint(self, path, checkpoint):
+		if not path:
+			return
+		with open(path + '.tmp', 'w') as fp:
+			json.dump(checkpoint, fp)
+		os.replace(path + '.tmp', path)
+
+	def handle(self, *args, **kwargs):
+		# cache tags are registered while importing views
+		import_module(settings.ROOT_URLCONF)
+		labels = set(label.lower() for label in kwargs['models'])
+		fields = get_rich_text_fields(labels)
+		if labels and not fields:
+			raise CommandError("No rich text fields in %s" % ', '.join(sorted(labels)))
+
+		checkpoint_path = kwargs['checkpoint']
+		checkpoint = self.load_checkpoint(checkpoint_path)
+		verbosity = int(kwargs['verbosity'])
+
+		pool = None
+		if kwargs['processes'] > 1:
+			# workers must not share connections with parent process
+			connections.close_all()
+			for cache in caches.all():
+				cache.close()
+			pool = multiprocessing.Pool(kwargs['processes'])
+
+		try:
+			for model, field in fields:
+				key = '%s.%s' % (model._meta.label_lower, field.name)
+				chunks = iter_chunks(model, field, checkpoint.get(key, 0), kwargs['chunk_size'])
+				results = imap_in_order(pool, render_chunk, chunks, kwargs['processes'] * 2) if pool else map(render_chunk, chunks)
+				start = time.time()
+				total = 0
+				total_changed = 0
+				invalidated = set()
+				for last_pk, count, changed in results:
+					write_chunk(model, field, changed)
+					invalidate_discussions(model, changed, invalidated)
+					checkpoint[key] = last_pk
+					self.save_checkpoint(checkpoint_path, checkpoint)
+					total += count
+					total_changed += len(changed)
+					if verbosity > 1:
+						self.stdout.write('%s: %d rows, %d changed, %.0f rows/s' % (key, total, total_changed, total / max(time.time() - start, 0.001)))
+				invalidate_model_cache(model)
+				if verbosity > 0:
+					self.stdout.write('%s: %d rows, %d changed in %.1fs' % (key, total, total_changed, time.time() - start))
+		finally:
+			if pool:
+				pool.close()
+				pool.join()
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...tasks import process_deferred_tasks
+
+
+class Command(BaseCommand):
+	help = 'Run tasks stored by database deferred tasks backend'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--loop', action='store_true', help='Keep running and poll for new tasks')
+		parser.add_argument('--interval', type=float, default=1.0, help='Poll interval in seconds')
+
+	def handle(self, *args, **kwargs):
+		while True:
+			count = process_deferred_tasks()
+			if int(kwargs['verbosity']) > 1 and count:
+				self.stdout.write('Processed %d tasks' % count)
+			if not kwargs['loop']:
+				break
+			time.sleep(kwargs['interval'])
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+	initial = True
+
+	dependencies = [
+	]
+
+	operations = [
+		migrations.CreateModel(
+			name='DeferredTask',
+			fields=[
+				('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+				('name', models.CharField(max_length=255)),
+				('arguments', models.TextField()),
+				('coalesce_key', models.CharField(blank=True, db_index=True, max_length=255)),
+				('created', models.DateTimeField(auto_now_add=True)),
+			],
+			options={
+				'ordering': ('pk',),
+				'verbose_name': 'odložená úloha',
+				'verbose_name_plural': 'odložené úlohy',
+			},
+		),
+	]
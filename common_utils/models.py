@@ -17,3 +17,15 @@ class TimestampModelMixin(models.Model):
 
 	class Meta:
 		abstract = True
+
+
+class DeferredTask(models.Model):
+	name = models.CharField(max_length=255)
+	arguments = models.TextField()
+	coalesce_key = models.CharField(max_length=255, blank=True, db_index=True)
+	created = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		ordering = ('pk',)
+		verbose_name = 'odložená úloha'
+		verbose_name_plural = 'odložené úlohy'
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import atexit
+import itertools
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connection, transaction, close_old_connections
+
+
+logger = logging.getLogger('shakal')
+
+DEFERRED_TASKS_BACKEND = getattr(settings, 'DEFERRED_TASKS_BACKEND', 'thread')
+DEFERRED_TASKS_BATCH_SIZE = 1000
+DEFERRED_TASKS_DRAIN_TIMEOUT = getattr(settings, 'DEFERRED_TASKS_DRAIN_TIMEOUT', 30)
+
+tasks_registry = {}
+
+
+def deferred_task(fun):
+	"""
+	Zaregistruje funkciu ako úlohu, ktorú je možné spustiť cez `defer`.
+	Argumenty úlohy musia byť serializovateľné do JSON-u.
+	"""
+	fun.task_name = fun.__module__ + '.' + fun.__name__
+	tasks_registry[fun.task_name] = fun
+	return fun
+
+
+def run_task(name, args):
+	try:
+		tasks_registry[name](*args)
+	except Exception: #pylint: disable=broad-except
+		logger.exception("Deferred task %s%r failed", name, tuple(args))
+
+
+class ImmediateBackend(object):
+	def enqueue(self, name, args, coalesce):
+		tasks_registry[name](*args)
+
+
+class ThreadBackend(object):
+	"""
+	Úlohy spúšťa lokálne vlákno. Rovnaké úlohy, ktoré čakajú vo fronte, sa
+	vykonajú iba raz. Pri ukončení procesu sa čakajúce úlohy dokončia, úlohy
+	sa však stratia pri páde procesu.
+	"""
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.event = threading.Event()
+		self.pending = OrderedDict()
+		self.counter = itertools.count()
+		self.thread = None
+		self.stopped = False
+		atexit.register(self.drain)
+
+	def enqueue(self, name, args, coalesce):
+		key = (name, tuple(args)) if coalesce else next(self.counter)
+		if self.stopped:
+			run_task(name, args)
+			return
+		with self.lock:
+			# coalesced task is moved to end of queue
+			self.pending.pop(key, None)
+			self.pending[key] = (name, args)
+			if self.thread is None or not self.thread.is_alive():
+				self.thread = threading.Thread(target=self.run, name='deferred-tasks')
+				self.thread.daemon = True
+				self.thread.start()
+		self.event.set()
+
+	def run(self):
+		while True:
+			if not self.stopped:
+				self.event.wait()
+			self.event.clear()
+			with self.lock:
+				tasks = list(self.pending.values())
+				self.pending.clear()
+				if not tasks and self.stopped:
+					return
+			for name, args in tasks:
+				run_task(name, args)
+			close_old_connections()
+
+	def drain(self):
+		"""
+		Dokončí čakajúce úlohy pred ukončením procesu.
+		"""
+		with self.lock:
+			self.stopped = True
+			thread = self.thread
+		self.event.set()
+		if thread is not None and thread.is_alive():
+			thread.join(DEFERRED_TASKS_DRAIN_TIMEOUT)
+			if thread.is_alive():
+				logger.warning("Deferred tasks were not finished in %ss", DEFERRED_TASKS_DRAIN_TIMEOUT)
+				return
+		with self.lock:
+			tasks = list(self.pending.values())
+			self.pending.clear()
+		for name, args in tasks:
+			run_task(name, args)
+
+
+class DatabaseBackend(object):
+	"""
+	Úlohy sa ukladajú do databázy a spúšťa ich príkaz `run_deferred_tasks`.
+	Súčasne môže bežať viac príkazov, každý si úlohy najskôr vyhradí
+	(odstráni z databázy) a až potom ich spustí.
+	"""
+
+	def enqueue(self, name, args, coalesce):
+		from .models import DeferredTask
+		arguments = json.dumps(list(args))
+		DeferredTask.objects.create(name=name, arguments=arguments, coalesce_key=name + arguments if coalesce else '')
+
+	def claim(self):
+		from .models import DeferredTask
+		with transaction.atomic():
+			queryset = DeferredTask.objects.all()
+			if connection.features.has_select_for_update_skip_locked:
+				queryset = queryset.select_for_update(skip_locked=True)
+			tasks = list(queryset[:DEFERRED_TASKS_BATCH_SIZE])
+			DeferredTask.objects.filter(pk__in=[task.pk for task in tasks]).delete()
+		return tasks
+
+	def process(self):
+		tasks = self.claim()
+		# coalesced task runs at position of its last occurrence
+		last_occurrence = {task.coalesce_key: task.pk for task in tasks if task.coalesce_key}
+		for task in tasks:
+			if task.coalesce_key and last_occurrence[task.coalesce_key] != task.pk:
+				continue
+			run_task(task.name, json.loads(task.arguments))
+		return len(tasks)
+
+
+BACKENDS = {
+	'immediate': ImmediateBackend,
+	'thread': ThreadBackend,
+	'database': DatabaseBackend,
+}
+
+backend = BACKENDS[DEFERRED_TASKS_BACKEND]()
+
+
+def defer(fun, *args, **kwargs):
+	"""
+	Spustí úlohu po potvrdení transakcie. Ak je `coalesce` True, čakajúce
+	úlohy s rovnakými argumentami sa vykonajú iba raz.
+	"""
+	coalesce = kwargs.pop('coalesce', False)
+	if DEFERRED_TASKS_BACKEND == 'immediate':
+		backend.enqueue(fun.task_name, args, coalesce)
+	else:
+		transaction.on_commit(lambda: backend.enqueue(fun.task_name, args, coalesce))
+
+
+def process_deferred_tasks():
+	if not isinstance(backend, DatabaseBackend):
+		return 0
+	count = 0
+	while True:
+		processed = backend.process()
+		count += processed
+		if processed < DEFERRED_TASKS_BATCH_SIZE:
+			return count
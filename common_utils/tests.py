@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db.models.signals import post_save
+from django.test import SimpleTestCase, TestCase
+
+from .models import DeferredTask
+from .tasks import DatabaseBackend, ThreadBackend, deferred_task
+from .cache import DjangoCache, cached_fn_raw, cached_fn_factory, get_invalidation_stats, default_key_builder
+from article.models import Article, Category
+from comments.models import Comment
+from rich_editor.tasks import highlight_filtered_field
+from rich_editor.widgets import TextVal
+
+
+class DjangoCacheTest(SimpleTestCase):
+	def setUp(self):
+		self.cache = DjangoCache()
+		self.cache.cache.clear()
+		self.calls = 0
+
+	def counter(self, *args):
+		self.calls += 1
+		return self.calls
+
+	def test_delete_tag(self):
+		fn = cached_fn_raw(self.counter, self.cache, tag='test.tag', name='counter')
+		self.assertEqual(fn(), 1)
+		self.assertEqual(fn(), 1)
+		# separate instance simulates other process
+		DjangoCache().delete_tag('test.tag')
+		self.assertEqual(fn(), 2)
+		self.assertEqual(fn(), 2)
+
+	def test_delete_other_tag(self):
+		fn = cached_fn_raw(self.counter, self.cache, tag='test.tag', name='counter')
+		self.assertEqual(fn(), 1)
+		self.cache.delete_tag('test.other')
+		self.assertEqual(fn(), 1)
+
+	def test_stale_value(self):
+		fn = cached_fn_raw(self.counter, self.cache, name='counter', max_age=60, stale_age=60)
+		self.assertEqual(fn(), 1)
+		key = self.cache.make_key('counter')
+		soft_expires, value = self.cache.get(key)
+		self.cache.set(key, (soft_expires - 120, value))
+		# other process is recomputing value
+		self.cache.add(key + ':lock', True)
+		self.assertEqual(fn(), 1)
+		self.cache.delete(key + ':lock')
+		self.assertEqual(fn(), 2)
+		self.assertEqual(fn(), 2)
+
+	def test_arguments(self):
+		fn = cached_fn_raw(self.counter, self.cache, tag='test.tag', name='counter')
+		self.assertEqual(fn(1), 1)
+		self.assertEqual(fn(2), 2)
+		self.assertEqual(fn(1), 1)
+
+
+class TagRegistrationTest(TestCase):
+	def setUp(self):
+		self.cache = DjangoCache()
+		self.cache.cache.clear()
+		self.calls = 0
+
+	def counter(self):
+		self.calls += 1
+		return self.calls
+
+	def test_registered_model(self):
+		fn = cached_fn_factory(self.cache)(tag='test.category', models=('article.category',))(self.counter)
+		self.assertEqual(fn(), 1)
+		Category.objects.create(name='category', slug='category')
+		self.assertEqual(fn(), 2)
+		self.assertEqual(get_invalidation_stats()['test.category'], 1)
+
+	def test_unregistered_model(self):
+		fn = cached_fn_factory(self.cache)(tag='test.unregistered', models=('article.article',))(self.counter)
+		self.assertEqual(fn(), 1)
+		Category.objects.create(name='category', slug='category')
+		self.assertEqual(fn(), 1)
+		self.assertEqual(get_invalidation_stats()['test.unregistered'], 0)
+
+
+class KeyBuilderTest(TestCase):
+	def setUp(self):
+		self.category = Category.objects.create(name='category', slug='category')
+
+	def test_distinct_keys(self):
+		keys = [
+			default_key_builder((1,), {}),
+			default_key_builder(('1',), {}),
+			default_key_builder((True,), {}),
+			default_key_builder((1.0,), {}),
+			default_key_builder(([1],), {}),
+			default_key_builder((), {'a': 1}),
+			default_key_builder((self.category,), {}),
+			default_key_builder((('article.category', self.category.pk),), {}),
+			default_key_builder(({'a': 1},), {}),
+			default_key_builder(((('a', 1),),), {}),
+		]
+		self.assertEqual(len(keys), len(set(keys)))
+
+	def test_mixed_dict_keys(self):
+		self.assertEqual(
+			default_key_builder(({1: 'a', 'b': 2},), {}),
+			default_key_builder(({'b': 2, 1: 'a'},), {})
+		)
+
+	def test_model_key(self):
+		category = Category.objects.get(pk=self.category.pk)
+		self.assertEqual(default_key_builder((category,), {}), default_key_builder((self.category,), {}))
+		category.name = 'changed'
+		self.assertEqual(default_key_builder((category,), {}), default_key_builder((self.category,), {}))
+
+
+calls = []
+
+
+@deferred_task
+def record_call(value):
+	calls.append(value)
+
+
+class DatabaseBackendTest(TestCase):
+	def setUp(self):
+		del calls[:]
+
+	def test_coalesce(self):
+		backend = DatabaseBackend()
+		backend.enqueue(record_call.task_name, (1,), True)
+		backend.enqueue(record_call.task_name, (2,), False)
+		backend.enqueue(record_call.task_name, (1,), True)
+		backend.enqueue(record_call.task_name, (2,), False)
+		self.assertEqual(backend.process(), 4)
+		self.assertEqual(calls, [2, 1, 2])
+		self.assertFalse(DeferredTask.objects.exists())
+
+	def test_claimed_tasks(self):
+		backend = DatabaseBackend()
+		backend.enqueue(record_call.task_name, (1,), False)
+		tasks = backend.claim()
+		self.assertEqual(len(tasks), 1)
+		self.assertEqual(backend.process(), 0)
+		self.assertEqual(calls, [])
+
+
+class ThreadBackendTest(TestCase):
+	def setUp(self):
+		del calls[:]
+
+	def test_drain(self):
+		backend = ThreadBackend()
+		for value in range(100):
+			backend.enqueue(record_call.task_name, (value,), False)
+		backend.drain()
+		self.assertEqual(calls, list(range(100)))
+		backend.enqueue(record_call.task_name, (100,), False)
+		self.assertEqual(calls[-1], 100)
+
+
+class RerenderRichTextTest(TestCase):
+	def test_rerender(self):
+		category = Category.objects.create(name='category', slug='category')
+		article = Article.objects.create(title='test', slug='test', category=category, original_content=TextVal('html:text'))
+		# nepublikovaný článok sa tiež prekreslí
+		Article.all_articles.filter(pk=article.pk).update(filtered_content='stale')
+		checkpoint = os.path.join(tempfile.mkdtemp(), 'checkpoint.json')
+		call_command('rerender_rich_text', 'article.article', processes=1, checkpoint=checkpoint, verbosity=0)
+		self.assertEqual(Article.all_articles.get(pk=article.pk).filtered_content, '<p>text</p>')
+		with open(checkpoint) as fp:
+			self.assertEqual(json.load(fp)['article.article.original_content'], article.pk)
+
+	def test_invalidate_discussion(self):
+		category = Category.objects.create(name='category', slug='category')
+		article = Article.objects.create(title='test', slug='test', category=category)
+		content_type = ContentType.objects.get_for_model(Article)
+		root = Comment.objects.get_or_create_root_comment(content_type, article.pk)[0]
+		comment = Comment.objects.create(parent=root, content_type=content_type, object_id=article.pk, subject='subject', user_name='user', original_comment=TextVal('html:text'))
+		Comment.objects.filter(pk=comment.pk).update(filtered_comment='stale')
+		with mock.patch('comments.utils.invalidate_discussion_cache') as invalidate:
+			call_command('rerender_rich_text', 'comments.comment', processes=1, verbosity=0)
+		invalidate.assert_called_once_with(content_type.pk, article.pk)
+
+
+class HighlightFilteredFieldTest(TestCase):
+	def test_unpublished(self):
+		category = Category.objects.create(name='category', slug='category')
+		article = Article.objects.create(title='test', slug='test', category=category, original_content=TextVal('html:<pre class="code-python">x = 1</pre>'))
+		Article.all_articles.filter(pk=article.pk).update(filtered_content='stale')
+		saved = []
+		receiver = lambda sender, **kwargs: saved.append(sender)
+		post_save.connect(receiver, sender=Article, weak=False)
+		try:
+			highlight_filtered_field('article.article', article.pk, 'original_content')
+		finally:
+			post_save.disconnect(receiver, sender=Article)
+		self.assertIn('<span', Article.all_articles.get(pk=article.pk).filtered_content)
+		self.assertEqual(saved, [])
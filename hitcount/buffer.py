@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Case, F, Q, When, Value, PositiveIntegerField
+
+
+HITCOUNT_WRITE_BEHIND = getattr(settings, 'HITCOUNT_WRITE_BEHIND', False)
+HITCOUNT_BUCKET_INTERVAL = getattr(settings, 'HITCOUNT_BUCKET_INTERVAL', 60)
+HITCOUNT_BUFFER_TIMEOUT = getattr(settings, 'HITCOUNT_BUFFER_TIMEOUT', 86400)
+HITCOUNT_FLUSH_BATCH_SIZE = 500
+HITCOUNT_FLUSH_LOCK_TIMEOUT = 600
+# najviac toľko okien sa číta pri zisťovaní počtu zobrazení, aj keď flush ešte nebežal
+HITCOUNT_MAX_PENDING_BUCKETS = 60
+
+
+class HitCountBuffer(object):
+	"""
+	Zbiera zobrazenia v zdieľanej cache a zapisuje ich dávkovo do databázy.
+
+	Počítadlá sú rozdelené do časových okien (bucket). Do aktuálneho okna sa
+	atomicky pripočítava cez `incr`, flush spracováva iba uzavreté okná, takže
+	počítadlá nie je potrebné zamykať.
+	"""
+
+	prefix = 'hitcount_buffer'
+
+	def __init__(self, cache_name='default', interval=HITCOUNT_BUCKET_INTERVAL, timeout=HITCOUNT_BUFFER_TIMEOUT):
+		self.cache = caches[cache_name]
+		self.interval = interval
+		self.timeout = timeout
+
+	def get_bucket(self):
+		return int(time.time() // self.interval)
+
+	def count_key(self, bucket, content_type_id, object_id):
+		return '%s:%d:c:%d:%d' % (self.prefix, bucket, content_type_id, object_id)
+
+	def sequence_key(self, bucket):
+		return '%s:%d:seq' % (self.prefix, bucket)
+
+	def entry_key(self, bucket, sequence):
+		return '%s:%d:e:%d' % (self.prefix, bucket, sequence)
+
+	@property
+	def flushed_key(self):
+		return '%s:flushed' % self.prefix
+
+	@property
+	def lock_key(self):
+		return '%s:lock' % self.prefix
+
+	def incr(self, key):
+		self.cache.add(key, 0, self.timeout)
+		try:
+			return self.cache.incr(key)
+		except ValueError: # expired between add and incr
+			self.cache.add(key, 1, self.timeout)
+			return 1
+
+	def hit(self, content_type_id, object_id):
+		bucket = self.get_bucket()
+		key = self.count_key(bucket, content_type_id, object_id)
+		if self.cache.add(key, 1, self.timeout):
+			# first hit in bucket, register object for flush
+			sequence = self.incr(self.sequence_key(bucket))
+			self.cache.set(self.entry_key(bucket, sequence), (content_type_id, object_id), self.timeout)
+		else:
+			self.incr(key)
+
+	def get_pending_buckets(self, last_bucket):
+		first_bucket = self.cache.get(self.flushed_key)
+		if first_bucket is None:
+			first_bucket = last_bucket - (self.timeout // self.interval) - 1
+		return range(first_bucket + 1, last_bucket + 1)
+
+	def get_pending(self, content_type_id, object_id):
+		last_bucket = self.get_bucket()
+		buckets = self.get_pending_buckets(last_bucket)
+		buckets = range(max(buckets.start, last_bucket - HITCOUNT_MAX_PENDING_BUCKETS + 1), buckets.stop)
+		keys = [self.count_key(bucket, content_type_id, object_id) for bucket in buckets]
+		return sum(self.cache.get_many(keys).values())
+
+	def collect(self, buckets):
+		hits = {}
+		keys = []
+
+		sequence_keys = {self.sequence_key(bucket): bucket for bucket in buckets}
+		sequences = self.cache.get_many(list(sequence_keys.keys()))
+		keys += list(sequence_keys.keys())
+
+		entry_keys = []
+		for sequence_key, sequence in sequences.items():
+			bucket = sequence_keys[sequence_key]
+			entry_keys += [self.entry_key(bucket, i) for i in range(1, sequence + 1)]
+		entries = self.cache.get_many(entry_keys)
+		keys += entry_keys
+
+		count_keys = {}
+		for entry_key, lookup in entries.items():
+			bucket = int(entry_key.split(':')[1])
+			count_keys[self.count_key(bucket, *lookup)] = lookup
+		counts = self.cache.get_many(list(count_keys.keys()))
+		keys += list(count_keys.keys())
+
+		for count_key, count in counts.items():
+			lookup = count_keys[count_key]
+			hits[lookup] = hits.get(lookup, 0) + count
+		return hits, keys
+
+	def flush(self):
+		"""
+		Zapíše počty zobrazení z uzavretých okien do databázy. Aktuálne a
+		predchádzajúce okno sa nespracováva kvôli požiadavkám, ktoré práve
+		zapisujú. Ak práve beží iný flush, nerobí nič.
+		"""
+		# súčasne spustený flush by započítal rovnaké okná dvakrát
+		if not self.cache.add(self.lock_key, 1, HITCOUNT_FLUSH_LOCK_TIMEOUT):
+			return {}
+		try:
+			last_bucket = self.get_bucket() - 2
+			buckets = self.get_pending_buckets(last_bucket)
+			if not buckets:
+				return {}
+			hits, keys = self.collect(buckets)
+			with transaction.atomic():
+				apply_hits(hits)
+			self.cache.set(self.flushed_key, last_bucket, None)
+			self.cache.delete_many(keys)
+			return hits
+		finally:
+			self.cache.delete(self.lock_key)
+
+
+def apply_hits(hits):
+	from .models import HitCount
+
+	hits = list((lookup, count) for lookup, count in hits.items() if count)
+	for offset in range(0, len(hits), HITCOUNT_FLUSH_BATCH_SIZE):
+		batch = dict(hits[offset:offset+HITCOUNT_FLUSH_BATCH_SIZE])
+		batch_q = Q()
+		for content_type_id, object_id in batch:
+			batch_q = batch_q | Q(content_type_id=content_type_id, object_id=object_id)
+		existing = set(HitCount.objects.filter(batch_q).values_list('content_type_id', 'object_id'))
+
+		HitCount.objects.bulk_create([
+			HitCount(content_type_id=lookup[0], object_id=lookup[1], hits=count)
+			for lookup, count in batch.items()
+			if lookup not in existing
+		])
+		if existing:
+			increment = Case(
+				*[When(content_type_id=lookup[0], object_id=lookup[1], then=Value(batch[lookup])) for lookup in existing],
+				default=Value(0),
+				output_field=PositiveIntegerField()
+			)
+			existing_q = Q()
+			for content_type_id, object_id in existing:
+				existing_q = existing_q | Q(content_type_id=content_type_id, object_id=object_id)
+			HitCount.objects.filter(existing_q).update(hits=F('hits') + increment)
+
+	from .cache import cache
+	cache.delete_hitcounts((object_id, content_type_id) for (content_type_id, object_id), __ in hits)
+
+
+hit_buffer = HitCountBuffer()
+
+
+def flush_hitcounts():
+	return hit_buffer.flush()
@@ -6,8 +6,10 @@ from common_utils.cache import ObjectCache
 
 class HitCountCache(ObjectCache):
 	def set_hitcount(self, object_id, content_type_id, count):
-		self.cache[object_id, content_type_id] = count
-		self.save()
+		self.set((object_id, content_type_id), count)
+
+	def delete_hitcounts(self, keys):
+		self.delete_many(keys)
 
 
 cache = HitCountCache('hitcount_cache')
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from ...buffer import flush_hitcounts
+
+
+class Command(BaseCommand):
+	help = 'Write buffered hit counts to database'
+
+	def handle(self, *args, **kwargs):
+		hits = flush_hitcounts()
+		if int(kwargs['verbosity']) > 1:
+			self.stdout.write('Flushed %d objects, %d hits' % (len(hits), sum(hits.values())))
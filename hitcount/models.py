@@ -6,6 +6,7 @@ from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.utils.encoding  import python_2_unicode_compatible, force_text
 
+from .buffer import HITCOUNT_WRITE_BEHIND, hit_buffer
 from .cache import cache
 
 
@@ -35,6 +36,10 @@ class HitCountField(models.Field):
 
 	def contribute_to_class(self, cls, name, **kwargs):
 		def hit(self):
+			if HITCOUNT_WRITE_BEHIND:
+				content_type = ContentType.objects.get_for_model(self.__class__)
+				hit_buffer.hit(content_type.pk, self.pk)
+				return
 			hit_count = HitCountField.get_hit_count(self.__class__, self.pk)
 			hit_count.hits += 1
 			hit_count.save()
@@ -46,5 +51,7 @@ class HitCountField(models.Field):
 			if not self.pk:
 				return 0
 			hit_count = HitCountField.get_hit_count(self.__class__, self.pk)
+			if HITCOUNT_WRITE_BEHIND:
+				return hit_count.hits + hit_buffer.get_pending(hit_count.content_type_id, hit_count.object_id)
 			return hit_count.hits
 		setattr(cls, name + '_count', property(hit_count))
@@ -13,32 +13,29 @@ from common_utils.content_types import get_lookups
 def add_hitcount(*models):
 	hitcounts_lookups, content_types = get_lookups(models)
 
-	hitcounts_lookups = {content_type: [i for i in id_list if (i, content_type.pk) not in cache.cache] for content_type, id_list in hitcounts_lookups.items()}
-	hitcounts_lookups = {content_type: id_list for content_type, id_list in hitcounts_lookups.items() if id_list}
-
-	for model, content_type in zip(models, content_types):
-		for obj in model:
-			obj.display_count = cache.cache.get((obj.pk, content_type.pk), None)
+	keys = [(object_id, content_type.pk) for content_type, id_list in hitcounts_lookups.items() for object_id in id_list]
+	hitcounts_dict = cache.get_many(keys)
 
-	if not hitcounts_lookups:
-		return ''
+	hitcounts_lookups = {content_type: [i for i in id_list if (i, content_type.pk) not in hitcounts_dict] for content_type, id_list in hitcounts_lookups.items()}
+	hitcounts_lookups = {content_type: id_list for content_type, id_list in hitcounts_lookups.items() if id_list}
 
-	hitcount_q = Q()
-	for content_type, ids in hitcounts_lookups.items():
-		hitcount_q = hitcount_q | Q(content_type=content_type, object_id__in=ids)
+	if hitcounts_lookups:
+		hitcount_q = Q()
+		for content_type, ids in hitcounts_lookups.items():
+			hitcount_q = hitcount_q | Q(content_type=content_type, object_id__in=ids)
 
-	hitcounts = HitCount.objects.all().\
-		filter(hitcount_q).\
-		values_list('object_id', 'content_type_id', 'hits')
-	hitcounts_dict = {h[:2]: h[2] for h in hitcounts}
+		hitcounts = HitCount.objects.all().\
+			filter(hitcount_q).\
+			values_list('object_id', 'content_type_id', 'hits')
+		new_hitcounts = {(object_id, content_type.pk): 0 for content_type, id_list in hitcounts_lookups.items() for object_id in id_list}
+		new_hitcounts.update({h[:2]: h[2] for h in hitcounts})
+		cache.set_many(new_hitcounts)
+		hitcounts_dict.update(new_hitcounts)
 
 	for model, content_type in zip(models, content_types):
+		if content_type is None:
+			continue
 		for obj in model:
-			key = (obj.pk, content_type.pk)
-			count = cache.cache.get(key, hitcounts_dict.get(key))
-			obj.display_count = count
-			cache.cache[key] = count
-
-	cache.save()
+			obj.display_count = hitcounts_dict.get((obj.pk, content_type.pk))
 
 	return ''
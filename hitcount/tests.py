@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+
+from .buffer import HitCountBuffer
+from .models import HitCount
+from article.models import Article, Category
+
+
+class HitCountBufferTest(TestCase):
+	def setUp(self):
+		self.category = Category.objects.create(name='category', slug='category')
+		self.article = Article.objects.create(title='test', slug='test', category=self.category)
+		self.article2 = Article.objects.create(title='test2', slug='test2', category=self.category)
+		self.content_type = ContentType.objects.get_for_model(Article)
+		self.buffer = HitCountBuffer()
+		self.buffer.cache.clear()
+		self.bucket = 1000
+		self.buffer.get_bucket = lambda: self.bucket
+
+	def get_hits(self, obj):
+		try:
+			return HitCount.objects.get(content_type=self.content_type, object_id=obj.pk).hits
+		except HitCount.DoesNotExist:
+			return 0
+
+	def test_flush(self):
+		HitCount.objects.create(content_type=self.content_type, object_id=self.article.pk, hits=5)
+		for __ in range(3):
+			self.buffer.hit(self.content_type.pk, self.article.pk)
+		self.buffer.hit(self.content_type.pk, self.article2.pk)
+		self.bucket += 1
+		self.buffer.hit(self.content_type.pk, self.article.pk)
+		self.assertEqual(self.buffer.get_pending(self.content_type.pk, self.article.pk), 4)
+
+		# current buckets are not flushed
+		self.buffer.flush()
+		self.assertEqual(self.get_hits(self.article), 5)
+
+		self.bucket += 1
+		self.buffer.flush()
+		self.assertEqual(self.get_hits(self.article), 8)
+		self.assertEqual(self.get_hits(self.article2), 1)
+
+		self.bucket += 1
+		self.buffer.flush()
+		self.assertEqual(self.get_hits(self.article), 9)
+		self.assertEqual(self.get_hits(self.article2), 1)
+		self.assertEqual(self.buffer.get_pending(self.content_type.pk, self.article.pk), 0)
+
+	def test_flush_locked(self):
+		self.buffer.hit(self.content_type.pk, self.article.pk)
+		self.bucket += 2
+		self.buffer.cache.add(self.buffer.lock_key, 1)
+		self.assertEqual(self.buffer.flush(), {})
+		self.assertEqual(self.get_hits(self.article), 0)
+		self.buffer.cache.delete(self.buffer.lock_key)
+		self.buffer.flush()
+		self.assertEqual(self.get_hits(self.article), 1)
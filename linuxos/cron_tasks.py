@@ -1,15 +1,20 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from collections import defaultdict
 from datetime import timedelta
 
-from django.db.models import Count, F
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count, F, Max
 from django.utils import timezone
 
 from accounts.models import UserRating
 from article.models import Article
 from attachment.models import UploadSession
-from comments.models import Comment
+from comments.models import Comment, RootHeader
+from common_utils.cache import invalidate_model_cache
+from common_utils.tasks import process_deferred_tasks
+from hitcount.buffer import flush_hitcounts
 from news.models import News
 from notifications.models import Event, Inbox
 from wiki.models import Page as WikiPage
@@ -105,3 +110,40 @@ def fix_duplicate_headers():
 					for node in list(child_nodes):
 						node.move_to(first_root, 'last-child')
 					root.delete()
+
+
+def reconcile_comments_headers():
+	statistics = (Comment.objects
+		.filter(is_public=True, is_removed=False, level__gt=0)
+		.order_by()
+		.values('content_type_id', 'object_id')
+		.annotate(cnt=Count('pk'), last=Max('created'))
+		.values_list('content_type_id', 'object_id', 'cnt', 'last'))
+	statistics = {(content_type_id, object_id): (cnt, last) for content_type_id, object_id, cnt, last in statistics.iterator()}
+
+	headers = (RootHeader.objects
+		.values_list('pk', 'content_type_id', 'object_id', 'comment_count', 'last_comment'))
+	changed = False
+	empty_discussions = defaultdict(dict)
+	for pk, content_type_id, object_id, comment_count, last_comment in headers.iterator():
+		count, last = statistics.get((content_type_id, object_id), (0, None))
+		if last is None:
+			# diskusia bez komentárov, čas posledného komentára je čas vytvorenia obsahu
+			empty_discussions[content_type_id][object_id] = (pk, comment_count, last_comment)
+			continue
+		if count != comment_count or last != last_comment:
+			RootHeader.objects.filter(pk=pk).update(comment_count=count, last_comment=last)
+			changed = True
+
+	for content_type_id, discussions in empty_discussions.items():
+		model = ContentType.objects.get_for_id(content_type_id).model_class()
+		created = {}
+		if model is not None and any(field.name == 'created' for field in model._meta.concrete_fields):
+			created = dict(model._base_manager.filter(pk__in=list(discussions.keys())).values_list('pk', 'created'))
+		for object_id, (pk, comment_count, last_comment) in discussions.items():
+			last = created.get(object_id, last_comment)
+			if comment_count != 0 or last != last_comment:
+				RootHeader.objects.filter(pk=pk).update(comment_count=0, last_comment=last)
+				changed = True
+	if changed:
+		invalidate_model_cache(RootHeader)
@@ -3,7 +3,7 @@ from __future__ import unicode_literals
 
 from django.core.management.base import BaseCommand
 
-from ...cron_tasks import delete_old_attachments, update_user_ratings, delete_old_events, fix_duplicate_headers
+from ...cron_tasks import delete_old_attachments, update_user_ratings, delete_old_events, fix_duplicate_headers, flush_hitcounts, reconcile_comments_headers, process_deferred_tasks
 
 
 class Command(BaseCommand):
@@ -14,7 +14,10 @@ class Command(BaseCommand):
 		super(Command, self).__init__(*args, **kwargs)
 
 	def handle(self, *args, **kwargs):
+		process_deferred_tasks()
 		delete_old_attachments()
 		delete_old_events()
 		update_user_ratings()
 		fix_duplicate_headers()
+		reconcile_comments_headers()
+		flush_hitcounts()
@@ -8,8 +8,38 @@ import xapian
 from haystack.backends import BaseEngine
 from xapian_backend import XapianSearchBackend as CoreXapianSearchBackend, XapianSearchQuery
 
+from search.analysis import fold_accents, get_term
+
+
+SLOVAK_LANGUAGES = ('sk', 'slovak')
+
+
+class SlovakStemImplementation(xapian.StemImplementation):
+	"""
+	Slovenský stemmer zo search.analysis, nevyžaduje upravený Xapian.
+	"""
+
+	def __call__(self, word):
+		# stop slová sa neodstraňujú, iba sa odstráni diakritika
+		return get_term(word) or fold_accents(word)
+
+	def get_description(self):
+		return 'slovak'
+
+
+slovak_stem_implementation = SlovakStemImplementation()
+# Xapian uvoľní implementáciu po zániku poslednej inštancie Stem, trvalá
+# referencia zabráni uvoľneniu objektu vlastneného pythonom
+slovak_stem = xapian.Stem(slovak_stem_implementation)
+
 
 class XapianSearchBackend(CoreXapianSearchBackend):
+	def __init__(self, connection_alias, **connection_options):
+		super(XapianSearchBackend, self).__init__(connection_alias, **connection_options)
+		if self.language in SLOVAK_LANGUAGES:
+			# xapian.Stem akceptuje okrem názvu jazyka aj implementáciu
+			self.language = slovak_stem_implementation
+
 	def _database(self, *args, **kwargs):
 		database = super(XapianSearchBackend, self)._database(*args, **kwargs)
 		if not hasattr(database, 'replace_document'):
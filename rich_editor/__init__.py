@@ -1,34 +1,68 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
 from rich_editor.parser import HtmlParser, RawParser, TextParser, ONELINE_TAGS_LIST, DEFAULT_TAG_LIST, FULL_TAGS_LIST
+from rich_editor.syntax import highlight_pre_blocks, PartiallyHighlighted, BACKGROUND_HIGHLIGHT_LENGTH
+
+
+RENDER_CACHE_TIMEOUT = getattr(settings, 'RICH_EDITOR_RENDER_CACHE_TIMEOUT', 86400 * 7)
+# zvýšiť pri zmene výstupu parserov alebo zvýrazňovania syntaxe
+RENDER_CACHE_VERSION = 1
+
+
+PARSERS = {
+	'signature': HtmlParser(supported_tags=ONELINE_TAGS_LIST, auto_paragraphs=False),
+	'profile': HtmlParser(supported_tags=FULL_TAGS_LIST, add_nofollow=False),
+	'blog': HtmlParser(supported_tags=FULL_TAGS_LIST, auto_paragraphs=False),
+	'full': HtmlParser(supported_tags=FULL_TAGS_LIST, auto_paragraphs=False),
+	'news_short': HtmlParser(supported_tags=DEFAULT_TAG_LIST, add_nofollow=False),
+	'news_long': HtmlParser(supported_tags=FULL_TAGS_LIST, add_nofollow=False),
+	'': HtmlParser(),
+}
+FORMAT_PARSERS = {
+	'raw': RawParser(),
+	'text': TextParser(),
+}
 
 
 def get_parser(parser, fmt='html'):
-	if fmt == 'raw':
-		return RawParser()
-	elif fmt == 'text':
-		return TextParser()
-	else:
-		if parser == 'signature':
-			parser_instance = HtmlParser(supported_tags=ONELINE_TAGS_LIST)
-			parser_instance.auto_paragraphs = False
-			return parser_instance
-		elif parser == 'profile':
-			parser_instance = HtmlParser(supported_tags=FULL_TAGS_LIST)
-			parser_instance.add_nofollow = False
-			return parser_instance
-		elif parser == 'blog' or parser == 'full':
-			parser_instance = HtmlParser(supported_tags=FULL_TAGS_LIST)
-			parser_instance.auto_paragraphs = False
-			return parser_instance
-		elif parser == 'news_short':
-			parser_instance = HtmlParser(supported_tags=DEFAULT_TAG_LIST)
-			parser_instance.add_nofollow = False
-			return parser_instance
-		elif parser == 'news_long':
-			parser_instance = HtmlParser(supported_tags=FULL_TAGS_LIST)
-			parser_instance.add_nofollow = False
-			return parser_instance
-		else:
-			return HtmlParser()
+	"""
+	Vráti zdieľanú inštanciu parsera. Inštancie sa vytvárajú raz pri načítaní
+	modulu.
+	"""
+	if fmt in FORMAT_PARSERS:
+		return FORMAT_PARSERS[fmt]
+	return PARSERS.get(parser, PARSERS[''])
+
+
+def get_render_cache_key(text, parser='', fmt='html'):
+	digest = hashlib.sha1('\0'.join((fmt, parser or '', text)).encode('utf-8')).hexdigest()
+	return 'rich_editor:render:%d:%s' % (RENDER_CACHE_VERSION, digest)
+
+
+def render(text, parser='', fmt='html', background=False, executor=None, refresh=False, cache=True):
+	"""
+	Vráti vyčistený a zvýraznený HTML kód textu. Výsledok sa ukladá do cache
+	podľa hashu formátu, parsera a textu, takže opakované uloženie rovnakého
+	textu nespúšťa parser znovu.
+
+	Ak je `background` True, dlhé bloky kódu sa nezvýrazňujú a výsledok typu
+	`PartiallyHighlighted` sa neukladá do cache. Ak je `refresh` True,
+	uložený výsledok aj zvýraznené bloky kódu sa ignorujú a prepíšu. Ak je
+	`cache` False (náhľady, koncepty), výsledok ani nové zvýraznené bloky sa
+	do cache neukladajú.
+	"""
+	render_cache = caches['default']
+	key = get_render_cache_key(text, parser, fmt)
+	output = None if refresh or not cache else render_cache.get(key)
+	if output is None:
+		max_code_length = BACKGROUND_HIGHLIGHT_LENGTH if background else None
+		output = highlight_pre_blocks(get_parser(parser, fmt).clean(text), max_code_length=max_code_length, executor=executor, refresh=refresh, update_cache=cache)
+		if cache and not isinstance(output, PartiallyHighlighted):
+			render_cache.set(key, output, RENDER_CACHE_TIMEOUT)
+	return output
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Meranie výkonu parserov a zvýrazňovania syntaxe.
+
+Spustenie::
+
+	DJANGO_SETTINGS_MODULE=web.settings python -m rich_editor.benchmark --iterations 10 --json results.json
+	DJANGO_SETTINGS_MODULE=web.settings python -m rich_editor.benchmark --baseline results.json
+
+S parametrom `--baseline` skončí s chybou, ak je niektorý prípad pomalší ako
+uložený výsledok o viac než `--tolerance`.
+"""
+from __future__ import unicode_literals
+
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict, namedtuple
+
+
+BenchmarkResult = namedtuple('BenchmarkResult', ['case', 'stage', 'chars', 'seconds', 'chars_per_second', 'peak_kb'])
+
+WORDS = ('linux', 'jadro', 'balík', 'distribúcia', 'príkaz', 'súbor', 'server', 'konfigurácia', 'a', 'je', 'na', 'v', 'so', 'že')
+INLINE_TAGS = ('strong', 'em', 'i', 'b', 'u', 'del', 'sub')
+PYTHON_CODE = 'def parse(text):\n\tfor line in text.split("\\n"):\n\t\tif line and line[0] != "#":\n\t\t\tyield line.strip() & 0xff\n'
+C_CODE = '#include <stdio.h>\n\nint main(int argc, char **argv) {\n\tprintf("%d &lt;\\n", argc);\n\treturn 0;\n}\n'
+
+
+def gen_sentence(rng, words=12):
+	return ' '.join(rng.choice(WORDS) for __ in range(words)).capitalize() + '.'
+
+
+def gen_paragraph(rng, sentences=5):
+	parts = []
+	for __ in range(sentences):
+		sentence = gen_sentence(rng)
+		if rng.random() < 0.3:
+			tag = rng.choice(INLINE_TAGS)
+			sentence = '<%s>%s</%s>' % (tag, sentence, tag)
+		if rng.random() < 0.2:
+			sentence += ' <a href="http://www.linuxos.sk/%d/">odkaz</a>' % rng.randint(1, 1000)
+		parts.append(sentence)
+	return ' '.join(parts)
+
+
+def gen_short_comments(rng):
+	return ['\n\n'.join(gen_paragraph(rng, rng.randint(1, 3)) for __ in range(rng.randint(1, 3))) for __ in range(50)]
+
+
+def gen_long_article(rng):
+	parts = []
+	for i in range(60):
+		if i % 10 == 0:
+			parts.append('<h2>%s</h2>' % gen_sentence(rng, 4))
+		if i % 7 == 0:
+			parts.append('<ul>%s</ul>' % ''.join('<li>%s</li>' % gen_sentence(rng) for __ in range(5)))
+		if i % 9 == 0:
+			parts.append('<blockquote>%s</blockquote>' % gen_paragraph(rng, 2))
+		parts.append('<p>%s</p>' % gen_paragraph(rng))
+	return ['\n'.join(parts)]
+
+
+def gen_code_wiki(rng):
+	parts = []
+	for i in range(40):
+		parts.append(gen_paragraph(rng, 2))
+		code = (PYTHON_CODE if i % 2 else C_CODE) * rng.randint(1, 10)
+		lang = 'python' if i % 2 else 'c'
+		parts.append('<pre class="code-%s">%s</pre>' % (lang, code.replace('<', '&lt;').replace('>', '&gt;')))
+	return ['\n\n'.join(parts)]
+
+
+def gen_nested_markup(__):
+	depth = 200
+	nested = ''.join('<%s>' % INLINE_TAGS[i % len(INLINE_TAGS)] for i in range(depth)) + 'text'
+	unclosed = '<p><strong><em>' * 100 + 'text\n\n' * 100
+	attributes = '<a ' + ' '.join('x%d="%d"' % (i, i) for i in range(200)) + '>link</a>'
+	unknown = '<xxx><script>alert(1)</script><style>p {}</style></xxx>' * 100
+	return [nested, unclosed, attributes, unknown]
+
+
+CORPUS = OrderedDict((
+	('short_comments', gen_short_comments),
+	('long_article', gen_long_article),
+	('code_wiki', gen_code_wiki),
+	('nested_markup', gen_nested_markup),
+))
+
+
+def get_corpus(seed=0):
+	rng = random.Random(seed)
+	return OrderedDict((name, generator(rng)) for name, generator in CORPUS.items())
+
+
+def get_stages():
+	from . import PARSERS
+	from .syntax import highlight_pre_blocks
+
+	stages = OrderedDict()
+	for name, parser in sorted(PARSERS.items()):
+		stages['parser:' + (name or 'default')] = parser.clean
+	stages['highlight'] = lambda text: highlight_pre_blocks(text, use_cache=False)
+	return stages
+
+
+def measure(fun, documents, iterations):
+	start = time.perf_counter()
+	for __ in range(iterations):
+		for document in documents:
+			fun(document)
+	seconds = (time.perf_counter() - start) / iterations
+
+	tracemalloc.start()
+	try:
+		for document in documents:
+			fun(document)
+		peak = tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+	return seconds, peak
+
+
+def run_benchmarks(iterations=5, cases=None, stages=None, seed=0):
+	corpus = get_corpus(seed)
+	all_stages = get_stages()
+	results = []
+	for case, documents in corpus.items():
+		if cases and case not in cases:
+			continue
+		chars = sum(len(document) for document in documents)
+		for stage, fun in all_stages.items():
+			if stages and stage not in stages:
+				continue
+			fun(documents[0]) # warm up
+			seconds, peak = measure(fun, documents, iterations)
+			results.append(BenchmarkResult(case, stage, chars, seconds, chars / seconds, peak // 1024))
+	return results
+
+
+def compare(results, baseline, tolerance=0.2):
+	"""
+	Vráti zoznam dvojíc (výsledok, pôvodná rýchlosť) pre prípady, ktoré sú
+	pomalšie ako `baseline`.
+	"""
+	baseline = {(row['case'], row['stage']): row['chars_per_second'] for row in baseline}
+	regressions = []
+	for result in results:
+		previous = baseline.get((result.case, result.stage))
+		if previous and result.chars_per_second < previous * (1 - tolerance):
+			regressions.append((result, previous))
+	return regressions
+
+
+def format_results(results):
+	from common_utils.asciitable import NamedtupleTablePrinter
+
+	rows = [
+		BenchmarkResult(r.case, r.stage, str(r.chars), '%.5f' % r.seconds, '%.0f' % r.chars_per_second, str(r.peak_kb))
+		for r in results
+	]
+	return NamedtupleTablePrinter(rows, BenchmarkResult).render()
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Benchmark rich_editor parsers')
+	parser.add_argument('--iterations', type=int, default=5)
+	parser.add_argument('--case', action='append', help='Run only selected corpus case (%s)' % ', '.join(CORPUS.keys()))
+	parser.add_argument('--stage', action='append', help='Run only selected stage (parser:name or highlight)')
+	parser.add_argument('--json', help='Save results to JSON file')
+	parser.add_argument('--baseline', help='Compare results with JSON file saved by --json')
+	parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown against baseline (default 0.2)')
+	args = parser.parse_args(argv)
+
+	import django
+	django.setup()
+
+	results = run_benchmarks(args.iterations, args.case, args.stage)
+	print(format_results(results))
+	if args.json:
+		with open(args.json, 'w') as fp:
+			json.dump([result._asdict() for result in results], fp, indent='\t')
+	if args.baseline:
+		with open(args.baseline) as fp:
+			regressions = compare(results, json.load(fp), args.tolerance)
+		for result, previous in regressions:
+			print('Regression %s %s: %.0f chars/s (baseline %.0f)' % (result.case, result.stage, result.chars_per_second, previous))
+		if regressions:
+			return 1
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
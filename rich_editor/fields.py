@@ -2,14 +2,39 @@
 from __future__ import unicode_literals
 
 from django.db.models import signals, TextField
+from django.db.models.query_utils import DeferredAttribute
 from django.utils import six
 
-from . import get_parser
+from common_utils.tasks import defer
+
+from . import get_parser, render
 from .forms import RichOriginalField
-from .syntax import highlight_pre_blocks
+from .syntax import PartiallyHighlighted, BACKGROUND_HIGHLIGHT_LENGTH
+from .tasks import highlight_filtered_field
 from .widgets import TextVal, RichOriginalEditor
 
 
+class OriginalValueDescriptor(DeferredAttribute):
+	"""
+	Pôvodnú hodnotu si uloží až pri prvom priradení do načítaného objektu,
+	takže načítanie objektov z databázy nemá žiadnu réžiu navyše.
+	"""
+
+	def __init__(self, field_name, original_attribute):
+		super(OriginalValueDescriptor, self).__init__(field_name)
+		self.original_attribute = original_attribute
+
+	def __set__(self, instance, value):
+		data = instance.__dict__
+		if self.original_attribute not in data:
+			if self.field_name in data:
+				data[self.original_attribute] = data[self.field_name]
+			elif not instance._state.adding:
+				# odložené pole, pôvodná hodnota nie je známa
+				data[self.original_attribute] = None
+		data[self.field_name] = value
+
+
 class RichTextOriginalField(TextField):
 	def __init__(self, filtered_field, property_name, parsers=None, *args, **kwargs):
 		super(RichTextOriginalField, self).__init__(*args, **kwargs)
@@ -55,43 +80,51 @@ class RichTextOriginalField(TextField):
 
 	def contribute_to_class(self, cls, name, **kwargs):
 		signals.pre_save.connect(self.update_filtered_field, sender=cls)
-		signals.post_init.connect(self.save_old_value, sender=cls)
+		if BACKGROUND_HIGHLIGHT_LENGTH is not None:
+			signals.post_save.connect(self.schedule_highlight, sender=cls)
 		self.create_filtered_property(cls, name)
 		super(RichTextOriginalField, self).contribute_to_class(cls, name)
+		setattr(cls, self.attname, OriginalValueDescriptor(self.attname, self.original_attribute))
+
+	@property
+	def original_attribute(self):
+		return '_%s_original' % self.name
+
+	def has_changed(self, instance):
+		data = instance.__dict__
+		return self.original_attribute in data and data[self.original_attribute] != data.get(self.attname)
 
 	def update_filtered_field(self, instance, **kwargs):
-		if not hasattr(instance, "old_values") or not self.name in instance.old_values or instance.old_values[self.name] != getattr(instance, self.name) or not instance.pk:
-			setattr(instance, self.filtered_field, self.filter_data(getattr(instance, self.name)))
+		if instance._state.adding or self.has_changed(instance):
+			instance.__dict__.pop(self.original_attribute, None)
+			filtered = self.filter_data(getattr(instance, self.name), background=True)
+			setattr(instance, self.filtered_field, filtered)
+			if isinstance(filtered, PartiallyHighlighted):
+				setattr(instance, self.highlight_pending_attribute, True)
+
+	@property
+	def highlight_pending_attribute(self):
+		return '_%s_highlight_pending' % self.name
 
-	def save_old_value(self, instance, **kwargs):
-		if not self.name in instance.__dict__:
-			return
-		old_values = getattr(instance, "old_values", {})
-		if hasattr(instance, self.name):
-			old_values[self.name] = getattr(instance, self.name)
-			setattr(instance, "old_values", old_values)
+	def schedule_highlight(self, instance, **kwargs):
+		if instance.__dict__.pop(self.highlight_pending_attribute, False):
+			defer(highlight_filtered_field, instance._meta.label_lower, instance.pk, self.name, coalesce=True)
 
 	def create_filtered_property(self, cls, field_name):
-		original_field = field_name
+		field = self
 		filtered_field = self.filtered_field
-		parsers = self.parsers
 
 		def filtered_property(self):
-			old_values = getattr(self, "old_values", {})
-			old_field_value = old_values.get(original_field, None)
-			if old_field_value is not None and getattr(self, original_field) != old_field_value:
-				value = getattr(self, original_field)
-				parser = parsers[value.field_format]
-				parser.parse(value.field_text)
-				parsed = parser.get_output()
-				parsed = highlight_pre_blocks(parsed)
-				old_values[original_field] = parsed
-				setattr(self, filtered_field, parsed)
+			if field.has_changed(self):
+				value = getattr(self, field_name)
+				setattr(self, filtered_field, field.filter_data(value))
+				# filtrovaný text zodpovedá aktuálnej hodnote
+				self.__dict__[field.original_attribute] = value
 			return getattr(self, filtered_field)
 		setattr(cls, self.property_name, property(filtered_property))
 
-	def filter_data(self, data):
-		if hasattr(data, 'field_filtered') and data.field_filtered is not None:
+	def filter_data(self, data, background=False, executor=None, refresh=False):
+		if hasattr(data, 'field_filtered') and data.field_filtered is not None and (background or not isinstance(data.field_filtered, PartiallyHighlighted)):
 			return data.field_filtered
 		if not isinstance(data, TextVal):
 			data = TextVal(data)
@@ -100,13 +133,9 @@ class RichTextOriginalField(TextField):
 		if not fmt:
 			return data
 		if fmt in self.parsers:
-			parser = self.parsers[fmt]
-			parser.parse(value)
-			parsed = parser.get_output()
+			return render(value, self.parsers_conf[fmt], fmt, background=background, executor=executor, refresh=refresh)
 		else:
-			parsed = value
-		parsed = highlight_pre_blocks(parsed)
-		return parsed
+			return render(value, fmt='raw', refresh=refresh)
 
 
 class RichTextFilteredField(TextField):
@@ -3,8 +3,8 @@ from __future__ import unicode_literals
 
 from django.forms import CharField
 
+from . import render
 from .parser import HtmlParser
-from .syntax import highlight_pre_blocks
 from .widgets import RichOriginalEditor, RichEditor, TextVal
 
 
@@ -21,8 +21,7 @@ class RichTextField(CharField):
 		return attrs
 
 	def clean(self, value):
-		self.parser.parse(value)
-		return self.parser.get_output()
+		return self.parser.clean(value)
 
 
 class RichOriginalField(CharField):
@@ -46,12 +45,9 @@ class RichOriginalField(CharField):
 		fmt = value.field_format
 		txt = super(RichOriginalField, self).clean(value.field_text)
 		if fmt in self.parsers:
-			parser = self.parsers.get(fmt, self.parsers[fmt])
-			parser.parse(txt)
-			parsed = parser.get_output()
+			parsed = render(txt, self.parsers_conf[fmt], fmt, background=True)
 		else:
-			parsed = txt
-		parsed = highlight_pre_blocks(parsed)
+			parsed = render(txt, fmt='raw')
 		val = TextVal(fmt + ':' + txt)
 		val.field_filtered = parsed
 		return val
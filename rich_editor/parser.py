@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
 import re
+import threading
+from collections import OrderedDict
+from functools import partial
 
 from bleach.sanitizer import Cleaner
 from django.template.defaultfilters import linebreaks_filter
 from django.utils.html import escape
 from html5lib.filters import base
-from html5lib.filters import alphabeticalattributes
 
 
 class AddRequiredAttributesFilter(base.Filter):
@@ -83,12 +85,95 @@ class AutoParagraphFilter(base.Filter):
 				yield {'name': 'p', 'type': 'StartTag', 'data': {}, 'namespace': None}
 
 
+def attribute_sort_key(attribute):
+	return (attribute[0][0] or ''), attribute[0][1]
+
+
+class HtmlFilter(base.Filter):
+	"""
+	Spojenie filtrov AddRequiredAttributesFilter, ClassFilter,
+	alphabeticalattributes.Filter, AutoParagraphFilter a AddNofollowFilter
+	do jedného prechodu. Výstup je zhodný s postupným použitím filtrov.
+	"""
+
+	CODE_RX = ClassFilter.CODE_RX
+	PARAGRAPH_RX = AutoParagraphFilter.PARAGRAPH_RX
+
+	def __init__(self, source, auto_paragraphs=True, add_nofollow=True):
+		super(HtmlFilter, self).__init__(source)
+		self.auto_paragraphs = auto_paragraphs
+		self.add_nofollow = add_nofollow
+
+	def __iter__(self):
+		auto_paragraphs = self.auto_paragraphs
+		add_nofollow = self.add_nofollow
+		text_tags = FULL_TEXT_TAGS
+		inside_block_tags = 0
+		inside_auto_paragraph = False
+		for token in base.Filter.__iter__(self):
+			token_type = token['type']
+			if token_type == 'StartTag':
+				name = token['name']
+				data = token['data']
+				if name == 'a':
+					data.setdefault((None, 'href'), '#')
+				elif name == 'img':
+					data.setdefault((None, 'src'), '#')
+					data.setdefault((None, 'alt'), '')
+				if name == 'pre' and (None, 'class') in data:
+					if not self.CODE_RX.match(data[(None, 'class')]):
+						del data[(None, 'class')]
+				else:
+					data.pop((None, 'class'), None)
+				if len(data) > 1:
+					token['data'] = data = OrderedDict(sorted(data.items(), key=attribute_sort_key))
+				if add_nofollow and name == 'a':
+					data[(None, 'rel')] = 'nofollow'
+			elif token_type == 'EmptyTag':
+				data = token['data']
+				if len(data) > 1:
+					token['data'] = OrderedDict(sorted(data.items(), key=attribute_sort_key))
+
+			if not auto_paragraphs:
+				yield token
+				continue
+
+			if token_type == 'StartTag' and token['name'] not in text_tags: # leave auto paragraph mode
+				inside_block_tags += 1
+				if inside_auto_paragraph:
+					inside_auto_paragraph = False
+					yield {'name': 'p', 'type': 'EndTag', 'namespace': None}
+
+			if not inside_auto_paragraph and not inside_block_tags: # enter auto paragraph mode
+				if (token_type == 'StartTag' and token['name'] in text_tags) or (token_type == 'Characters' and token['data'].strip()):
+					inside_auto_paragraph = True
+					yield {'name': 'p', 'type': 'StartTag', 'data': {}, 'namespace': None}
+
+			if inside_auto_paragraph and token_type == 'Characters' and '\n\n' in token['data']:
+				for part in self.PARAGRAPH_RX.split(token['data']):
+					if part[:2] == '\n\n':
+						yield {'name': 'p', 'type': 'EndTag', 'namespace': None}
+						yield {'type': 'Characters', 'data': part}
+						yield {'name': 'p', 'type': 'StartTag', 'data': {}, 'namespace': None}
+					elif part:
+						yield {'type': 'Characters', 'data': part}
+			else:
+				yield token
+
+			if token_type == 'EndTag' and token['name'] not in text_tags:
+				inside_block_tags -= 1
+
+		if inside_auto_paragraph:
+			yield {'name': 'p', 'type': 'EndTag', 'namespace': None}
+
+
 ALL_TAGS = ['a', 'abbr', 'acronym', 'address', 'applet', 'area', 'article', 'aside', 'audio', 'b', 'base', 'basefont', 'bdi', 'bdo', 'big', 'blockquote', 'body', 'br', 'button', 'canvas', 'caption', 'center', 'cite', 'code', 'col', 'colgroup', 'command', 'datalist', 'dd', 'del', 'details', 'dfn', 'dir', 'div', 'dl', 'dt', 'em', 'embed', 'fieldset', 'figcaption', 'figure', 'font', 'footer', 'form', 'frame', 'frameset', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'head', 'header', 'hgroup', 'hr', 'html', 'i', 'iframe', 'img', 'input', 'ins', 'kbd', 'keygen', 'label', 'legend', 'li', 'link', 'map', 'mark', 'menu', 'meta', 'meter', 'nav', 'noframes', 'noscript', 'object', 'ol', 'optgroup', 'option', 'output', 'p', 'param', 'pre', 'progress', 'q', 'rp', 'rt', 'ruby', 's', 'samp', 'script', 'section', 'select', 'small', 'source', 'span', 'strike', 'strong', 'style', 'sub', 'summary', 'sup', 'table', 'tbody', 'td', 'textarea', 'tfoot', 'th', 'thead', 'time', 'title', 'tr', 'track', 'tt', 'u', 'ul', 'var', 'video', 'wbr']
 
 
 TEXT_TAGS_LIST = ['b', 'u', 'i', 'em', 'strong', 'a', 'br', 'del', 'ins', 'sub', 'sup']
 ONELINE_TAGS_LIST = ['b', 'u', 'i', 'em', 'strong', 'a']
 FULL_TEXT_TAGS_LIST = ['b', 'u', 'i', 'em', 'strong', 'a', 'br', 'del', 'ins', 'abbr', 'img', 'sub', 'sup']
+FULL_TEXT_TAGS = frozenset(FULL_TEXT_TAGS_LIST)
 FULL_TAGS_LIST = ['b', 'u', 'i', 'em', 'strong', 'a', 'pre', 'p', 'span', 'br', 'del', 'ins', 'sub', 'sup', 'code', 'blockquote', 'cite', 'ol', 'ul', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'dl', 'dt', 'dd', 'abbr', 'img', 'table', 'thead', 'tbody', 'tfoot', 'caption', 'tr', 'th', 'td']
 DEFAULT_TAG_LIST = ['b', 'u', 'i', 'em', 'strong', 'a', 'pre', 'p', 'span', 'br', 'del', 'ins', 'sub', 'sup', 'code', 'blockquote', 'cite', 'ol', 'ul', 'li']
 ALLOWED_ATTRIBUTES = {
@@ -102,56 +187,58 @@ ALLOWED_ATTRIBUTES = {
 }
 
 
-class HtmlParser:
-	auto_paragraphs = True
-	add_nofollow = True
-	cleaner = None
+class BaseParser(object):
+	"""
+	Konfigurácia parsera je po vytvorení nemenná a inštanciu je možné
+	zdieľať medzi vláknami. Výstup `parse` sa ukladá pre každé vlákno zvlášť.
+	"""
 
-	def __init__(self, supported_tags=None):
-		if supported_tags is None:
-			supported_tags = DEFAULT_TAG_LIST
-		else:
-			supported_tags = supported_tags
-		self.cleaner = Cleaner(tags=supported_tags, attributes=ALLOWED_ATTRIBUTES)
+	def __init__(self):
+		self.local = threading.local()
+
+	def clean(self, text):
+		raise NotImplementedError()
 
 	def parse(self, text):
-		filters = [AddRequiredAttributesFilter, ClassFilter, alphabeticalattributes.Filter]
-		if self.auto_paragraphs:
-			filters.append(AutoParagraphFilter)
-		if self.add_nofollow:
-			filters.append(AddNofollowFilter)
-		self.cleaner.filters = filters
-		output = self.cleaner.clean(text)
-		self.output = output
+		self.local.output = self.clean(text)
 
 	def get_output(self):
-		return self.output
+		return self.local.output
 
 	def get_attributes(self):
 		return {}
 
-	@property
-	def supported_tags(self):
-		return self.cleaner.tags
 
+class HtmlParser(BaseParser):
+	def __init__(self, supported_tags=None, auto_paragraphs=True, add_nofollow=True):
+		super(HtmlParser, self).__init__()
+		if supported_tags is None:
+			supported_tags = DEFAULT_TAG_LIST
+		self.tags = tuple(supported_tags)
+		self.filters = (partial(HtmlFilter, auto_paragraphs=auto_paragraphs, add_nofollow=add_nofollow),)
 
-class RawParser:
-	def parse(self, text):
-		self.output = text
+	@property
+	def cleaner(self):
+		# html5lib parser v bleach Cleaner-i nie je thread-safe
+		cleaner = getattr(self.local, 'cleaner', None)
+		if cleaner is None:
+			cleaner = Cleaner(tags=list(self.tags), attributes=ALLOWED_ATTRIBUTES, filters=list(self.filters))
+			self.local.cleaner = cleaner
+		return cleaner
 
-	def get_output(self):
-		return self.output
+	def clean(self, text):
+		return self.cleaner.clean(text)
 
-	def get_attributes(self):
-		return {}
+	@property
+	def supported_tags(self):
+		return list(self.tags)
 
 
-class TextParser:
-	def parse(self, text):
-		self.output = linebreaks_filter(escape(text))
+class RawParser(BaseParser):
+	def clean(self, text):
+		return text
 
-	def get_output(self):
-		return self.output
 
-	def get_attributes(self):
-		return {}
+class TextParser(BaseParser):
+	def clean(self, text):
+		return linebreaks_filter(escape(text))
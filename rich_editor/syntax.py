@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import hashlib
 import re
+from collections import OrderedDict, namedtuple
 
+from django.conf import settings
+from django.core.cache import caches
 from django.template.defaultfilters import striptags
+from django.utils import six
 
 from search.templatetags.html_entity_decode import html_entity_decode_char, xml_entity_decode_char
 
@@ -62,8 +67,29 @@ LEXERS = (
 )
 
 
+LEXER_NAMES = frozenset(name for name, __ in LEXERS)
+MAX_CODE_LENGTH = 200000
+HIGHLIGHT_CACHE_TIMEOUT = getattr(settings, 'RICH_EDITOR_HIGHLIGHT_CACHE_TIMEOUT', 86400 * 7)
+# zvýšiť pri zmene verzie pygments alebo nastavení formátovania
+HIGHLIGHT_CACHE_VERSION = 1
+# bloky dlhšie ako tento limit sa pri ukladaní zvýraznia na pozadí
+BACKGROUND_HIGHLIGHT_LENGTH = getattr(settings, 'RICH_EDITOR_BACKGROUND_HIGHLIGHT_LENGTH', None)
+HIGHLIGHT_PROCESSES = getattr(settings, 'RICH_EDITOR_HIGHLIGHT_PROCESSES', 0)
+
 ENTITY_PATTERN = re.compile(r'&(\w+?);')
 DECIMAL_ENTITY_PATTERN = re.compile(r'&\#(\d+?);')
+CODE_BLOCK_OPEN_PATTERN = re.compile(r'<pre\s+class="code-([^"]+)">')
+CODE_BLOCK_CLOSE_PATTERN = re.compile(r'</\s*pre>')
+
+lexers_cache = {}
+formatter_cache = []
+executor_cache = []
+
+
+class PartiallyHighlighted(six.text_type):
+	"""
+	Výstup, v ktorom ostali niektoré bloky kódu nezvýraznené.
+	"""
 
 
 def html_entity_decode(string):
@@ -71,36 +97,149 @@ def html_entity_decode(string):
 	return DECIMAL_ENTITY_PATTERN.sub(xml_entity_decode_char, without_entity)
 
 
+def get_lexer(lang):
+	if lang not in lexers_cache:
+		from pygments import lexers, util
+		try:
+			lexers_cache[lang] = lexers.get_lexer_by_name(lang)
+		except util.ClassNotFound:
+			lexers_cache[lang] = None
+	return lexers_cache[lang]
+
+
+def get_formatter():
+	if not formatter_cache:
+		from pygments import formatters
+		formatter = formatters.get_formatter_by_name('html')
+		formatter.nowrap = True
+		formatter_cache.append(formatter)
+	return formatter_cache[0]
+
+
 def format_code(code, lang):
 	import pygments
-	from pygments import lexers, formatters, util
 
-	if not lang in dict(LEXERS):
+	if not lang in LEXER_NAMES:
 		return None
 
-	if len(code) > 200000:
+	if len(code) > MAX_CODE_LENGTH:
 		return None
 	code = code.replace('\t', '    ')
 
-	try:
-		lexer = lexers.get_lexer_by_name(lang)
-	except util.ClassNotFound:
+	lexer = get_lexer(lang)
+	if lexer is None:
 		return None
 
-	formatter = formatters.get_formatter_by_name('html')
-	formatter.nowrap = True
-
-	return pygments.highlight(code, lexer, formatter)
+	return pygments.highlight(code, lexer, get_formatter())
 
 
-def highlight_block(match):
-	lang = match.group(2)
-	code = format_code(html_entity_decode(striptags(match.group(3))), lang)
-	if code is None:
-		return ''.join((match.group(1), match.group(3), match.group(4)))
+def get_highlight_executor():
+	if not HIGHLIGHT_PROCESSES:
+		return None
+	if not executor_cache:
+		from concurrent.futures import ProcessPoolExecutor
+		executor_cache.append(ProcessPoolExecutor(max_workers=HIGHLIGHT_PROCESSES))
+	return executor_cache[0]
+
+
+def get_highlight_cache_key(code, lang):
+	digest = hashlib.sha1(code.encode('utf-8')).hexdigest()
+	return 'rich_editor:highlight:%d:%s:%s' % (HIGHLIGHT_CACHE_VERSION, lang, digest)
+
+
+CodeBlock = namedtuple('CodeBlock', ['start', 'end', 'open_tag', 'lang', 'content', 'close_tag'])
+
+
+def iter_code_blocks(html):
+	"""
+	Nájde bloky `<pre class="code-jazyk">...</pre>` jedným prechodom cez
+	text. Začiatok a koniec bloku sa hľadajú cez `str.find` a regulárny výraz
+	sa skúša iba na nájdených pozíciách, obsah bloku sa neprechádza znak po
+	znaku.
+	"""
+	position = 0
+	while True:
+		start = html.find('<pre', position)
+		if start == -1:
+			return
+		open_match = CODE_BLOCK_OPEN_PATTERN.match(html, start)
+		if open_match is None:
+			position = start + 4
+			continue
+		close = open_match.end()
+		while True:
+			close = html.find('</', close)
+			if close == -1:
+				# bez uzatváracej značky už nie je žiadny ďalší blok
+				return
+			close_match = CODE_BLOCK_CLOSE_PATTERN.match(html, close)
+			if close_match is not None:
+				break
+			close += 2
+		yield CodeBlock(start, close_match.end(), open_match.group(0), open_match.group(1), html[open_match.end():close], close_match.group(0))
+		position = close_match.end()
+
+
+def highlight_pre_blocks(html, max_code_length=None, executor=None, use_cache=True, refresh=False, update_cache=True):
+	"""
+	Zvýrazní syntax v blokoch `<pre class="code-jazyk">`. Zvýraznené bloky sa
+	ukladajú do cache podľa jazyka a hashu kódu, takže pri úprave dokumentu
+	sa znovu spracujú iba zmenené bloky.
+
+	Bloky dlhšie ako `max_code_length`, ktoré nie sú v cache, sa nezvýraznia
+	a výsledok je typu `PartiallyHighlighted`. Ak je zadaný `executor`, bloky
+	sa zvýrazňujú paralelne. Parameter `use_cache` slúži na meranie výkonu.
+	Ak je `refresh` True, bloky sa zvýraznia znovu a cache sa prepíše. Ak je
+	`update_cache` False, nové zvýraznené bloky sa do cache neukladajú.
+	"""
+	blocks = []
+	for block in iter_code_blocks(html):
+		if block.lang in LEXER_NAMES:
+			code = html_entity_decode(striptags(block.content))
+			blocks.append((block, get_highlight_cache_key(code, block.lang), code))
+		else:
+			blocks.append((block, None, None))
+	if not blocks:
+		return html
+
+	cache = caches['default']
+	if use_cache and not refresh:
+		highlighted = cache.get_many([key for __, key, __ in blocks if key is not None])
 	else:
-		return match.group(1) + code + match.group(4)
-
-
-def highlight_pre_blocks(html):
-	return re.sub(r'(<pre\s+class="code-([^"]+)">)(.*?)(</\s*pre>)', highlight_block, html, flags=re.DOTALL)
+		highlighted = {}
+	missing = OrderedDict()
+	skipped = False
+	for block, key, code in blocks:
+		if key is None or key in highlighted:
+			continue
+		if max_code_length is not None and len(code) > max_code_length:
+			skipped = True
+		else:
+			missing[key] = (code, block.lang)
+	new_highlighted = {}
+	if missing:
+		codes, langs = zip(*missing.values())
+		if executor is None:
+			results = map(format_code, codes, langs)
+		else:
+			results = executor.map(format_code, codes, langs)
+		for key, formatted in zip(missing.keys(), results):
+			if formatted is not None:
+				highlighted[key] = new_highlighted[key] = formatted
+	if new_highlighted and use_cache and update_cache:
+		cache.set_many(new_highlighted, HIGHLIGHT_CACHE_TIMEOUT)
+
+	output = []
+	position = 0
+	for block, key, code in blocks:
+		output.append(html[position:block.start])
+		if key in highlighted:
+			output.append(block.open_tag + highlighted[key] + block.close_tag)
+		else:
+			output.append(html[block.start:block.end])
+		position = block.end
+	output.append(html[position:])
+	output = ''.join(output)
+	if skipped:
+		output = PartiallyHighlighted(output)
+	return output
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.apps import apps
+
+from common_utils.cache import invalidate_model_cache
+from common_utils.tasks import deferred_task
+
+from .syntax import get_highlight_executor
+
+
+@deferred_task
+def highlight_filtered_field(model_label, pk, field_name):
+	"""
+	Dokončí zvýraznenie syntaxe, ktoré bolo pri uložení odložené. Výsledok
+	sa zapíše cez `update` bez signálov modelu, cache sa invaliduje explicitne.
+	"""
+	model = apps.get_model(model_label)
+	field = model._meta.get_field(field_name)
+	value = model._base_manager.filter(pk=pk).values_list(field.attname, flat=True).first()
+	if value is None:
+		return
+	filtered = field.filter_data(value, executor=get_highlight_executor())
+	# obsah sa medzičasom zmenil, zvýraznenie zabezpečí nové uloženie
+	updated = (model._base_manager
+		.filter(pk=pk, **{field.attname: value})
+		.update(**{field.filtered_field: filtered}))
+	if updated:
+		invalidate_highlighted(model, pk)
+
+
+def invalidate_highlighted(model, pk):
+	from comments.models import Comment
+	from comments.utils import invalidate_discussion_cache
+	invalidate_model_cache(model)
+	if model is Comment:
+		discussion = Comment.objects.filter(pk=pk).values_list('content_type_id', 'object_id').first()
+		if discussion is not None:
+			invalidate_discussion_cache(*discussion)
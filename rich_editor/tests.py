@@ -1,14 +1,21 @@
 # -*- coding: utf-8 -*-
+import threading
+from unittest import mock
+
+from bleach.sanitizer import Cleaner
+from django.core.cache import caches
+from html5lib.filters import alphabeticalattributes
 from django.test import TestCase
-from rich_editor.parser import HtmlParser
-from rich_editor import get_parser
+from django.urls import reverse
+from rich_editor.parser import HtmlParser, AddRequiredAttributesFilter, ClassFilter, AutoParagraphFilter, AddNofollowFilter, ALLOWED_ATTRIBUTES, FULL_TAGS_LIST
+from rich_editor import PARSERS, get_parser, get_render_cache_key, render
+from rich_editor.benchmark import compare, get_corpus, run_benchmarks
+from rich_editor.syntax import get_highlight_cache_key, get_lexer, highlight_pre_blocks, iter_code_blocks, PartiallyHighlighted
 
 
 class ParserTest(TestCase):
 	def setUp(self):
-		self.parser = HtmlParser()
-		self.parser.auto_paragraphs = True
-		self.parser.add_nofollow = False
+		self.parser = HtmlParser(auto_paragraphs=True, add_nofollow=False)
 
 	def test_auto_paragraph(self):
 		code = """Test"""
@@ -90,3 +97,177 @@ class ParserTest(TestCase):
 		code = """<pre class="wrong">wrong</pre>"""
 		self.parser.parse(code)
 		self.assertEqual(self.parser.get_output(), """<pre>wrong</pre>""")
+
+
+class ParserRegistryTest(TestCase):
+	def test_shared_instance(self):
+		self.assertIs(get_parser('signature'), get_parser('signature'))
+		self.assertIs(get_parser('unknown'), get_parser(''))
+		self.assertIs(get_parser('signature', 'raw'), get_parser('blog', 'raw'))
+
+	def test_thread_output(self):
+		parser = get_parser('')
+		parser.parse('main')
+		thread = threading.Thread(target=lambda: parser.parse('thread'))
+		thread.start()
+		thread.join()
+		self.assertEqual(parser.get_output(), '<p>main</p>')
+
+	def test_shared_output(self):
+		parser = get_parser('news_long')
+		texts = (
+			'<p>Paragraph <a href="http://www.linuxos.sk">link</a></p>',
+			'text\n\n<script>alert(1)</script>',
+			'<p>Paragraph <a href="http://www.linuxos.sk">link</a></p>',
+		)
+		for text in texts:
+			self.assertIs(get_parser('news_long'), parser)
+			fresh = HtmlParser(supported_tags=FULL_TAGS_LIST, add_nofollow=False)
+			self.assertEqual(parser.clean(text), fresh.clean(text))
+
+
+class RenderCacheTest(TestCase):
+	def setUp(self):
+		caches['default'].clear()
+
+	def test_cached(self):
+		code = """<pre class="code-python">print(1)</pre>"""
+		with mock.patch.object(HtmlParser, 'clean', autospec=True, side_effect=HtmlParser.clean) as clean:
+			output = render(code, 'full')
+			self.assertEqual(render(code, 'full'), output)
+			self.assertEqual(clean.call_count, 1)
+		self.assertIn('<span', output)
+
+	def test_refresh(self):
+		code = """<pre class="code-python">print(1)</pre>"""
+		render(code, 'full')
+		with mock.patch('rich_editor.syntax.format_code', return_value='refreshed') as format_code:
+			output = render(code, 'full', refresh=True)
+			format_code.assert_called_once_with('print(1)', 'python')
+		self.assertIn('refreshed', output)
+		self.assertEqual(render(code, 'full'), output)
+
+	def test_key(self):
+		self.assertNotEqual(get_render_cache_key('text', 'full'), get_render_cache_key('text', ''))
+		self.assertNotEqual(get_render_cache_key('text', '', 'html'), get_render_cache_key('text', '', 'text'))
+		self.assertEqual(render('a\n\nb', fmt='text'), '<p>a</p>\n\n<p>b</p>')
+
+
+class HighlightTest(TestCase):
+	def setUp(self):
+		caches['default'].clear()
+
+	def test_highlight(self):
+		code = 'A<pre class="code-python">x = &quot;&lt;b&gt;&quot;</pre>B<pre class="code-unknown">raw</pre><pre class="code-c">int x;</pre>'
+		output = highlight_pre_blocks(code)
+		self.assertTrue(output.startswith('A<pre class="code-python"><span'))
+		self.assertIn('B<pre class="code-unknown">raw</pre><pre class="code-c"><span', output)
+		self.assertIn('"&lt;b&gt;"', output)
+		with mock.patch('rich_editor.syntax.format_code') as format_code:
+			self.assertEqual(highlight_pre_blocks(code), output)
+			format_code.assert_not_called()
+
+	def test_code_blocks(self):
+		html = '<pre class="x">a</pre><pre class="code-c">int x;</ pre><p>b</p><pre class="code-python">1 < 2</p></pre><pre class="code-c">open'
+		blocks = list(iter_code_blocks(html))
+		self.assertEqual([(block.lang, block.content) for block in blocks], [('c', 'int x;'), ('python', '1 < 2</p>')])
+		self.assertEqual(html[blocks[0].start:blocks[0].end], '<pre class="code-c">int x;</ pre>')
+
+	def test_shared_lexer(self):
+		self.assertIs(get_lexer('python'), get_lexer('python'))
+		self.assertIsNone(get_lexer('nonexistent'))
+
+	def test_background(self):
+		code = '<pre class="code-python">short = 1</pre><pre class="code-python">' + 'long = 1\n' * 10 + '</pre>'
+		output = highlight_pre_blocks(code, max_code_length=20)
+		self.assertIsInstance(output, PartiallyHighlighted)
+		self.assertTrue(output.startswith('<pre class="code-python"><span'))
+		self.assertIn('<pre class="code-python">long = 1\n', output)
+		output = highlight_pre_blocks(code)
+		self.assertNotIsInstance(output, PartiallyHighlighted)
+		self.assertNotIsInstance(highlight_pre_blocks(code, max_code_length=20), PartiallyHighlighted)
+
+	def test_render_background(self):
+		code = '<pre class="code-python">' + 'long = 1\n' * 10 + '</pre>'
+		with mock.patch('rich_editor.BACKGROUND_HIGHLIGHT_LENGTH', 20):
+			self.assertIsInstance(render(code, 'full', background=True), PartiallyHighlighted)
+			self.assertIsNone(caches['default'].get(get_render_cache_key(code, 'full')))
+			output = render(code, 'full')
+			self.assertNotIsInstance(output, PartiallyHighlighted)
+			self.assertEqual(render(code, 'full', background=True), output)
+
+
+class BenchmarkTest(TestCase):
+	def test_run(self):
+		results = run_benchmarks(iterations=1, cases=['short_comments', 'code_wiki'])
+		self.assertEqual(len(results), 2 * (len(PARSERS) + 1))
+		self.assertTrue(all(result.chars_per_second > 0 for result in results))
+		baseline = [dict(result._asdict(), chars_per_second=result.chars_per_second * 2) for result in results[:1]]
+		self.assertEqual([r for r, __ in compare(results, baseline)], results[:1])
+		self.assertEqual(compare(results, [result._asdict() for result in results]), [])
+
+
+class HtmlFilterTest(TestCase):
+	def get_chain_cleaner(self, parser, auto_paragraphs, add_nofollow):
+		filters = [AddRequiredAttributesFilter, ClassFilter, alphabeticalattributes.Filter]
+		if auto_paragraphs:
+			filters.append(AutoParagraphFilter)
+		if add_nofollow:
+			filters.append(AddNofollowFilter)
+		return Cleaner(tags=list(parser.tags), attributes=ALLOWED_ATTRIBUTES, filters=filters)
+
+	def test_same_output(self):
+		documents = [document for documents in get_corpus().values() for document in documents]
+		documents += [
+			'<a href="x" title="t" rel="r" class="c">link</a>\n\n<a>x</a>',
+			'<pre class="code-c">int</pre><pre class="bad x">x</pre>text\n\n\ntext\n\n',
+			'<img src="s" alt="a" class="x"><br>text<blockquote>a\n\nb</blockquote>c',
+		]
+		for auto_paragraphs in (True, False):
+			for add_nofollow in (True, False):
+				parser = HtmlParser(supported_tags=FULL_TAGS_LIST, auto_paragraphs=auto_paragraphs, add_nofollow=add_nofollow)
+				chain = self.get_chain_cleaner(parser, auto_paragraphs, add_nofollow)
+				for document in documents:
+					self.assertEqual(parser.clean(document), chain.clean(document))
+
+
+class PreviewTest(TestCase):
+	def setUp(self):
+		caches['default'].clear()
+		self.url = reverse('rich_editor:preview')
+
+	def test_preview(self):
+		response = self.client.post(self.url, {'format': 'html', 'parser': '', 'text': 'text'})
+		self.assertEqual(response.content, b'<p>text</p>')
+
+	def test_text(self):
+		with mock.patch('rich_editor.views.render') as render_mock:
+			response = self.client.post(self.url, {'format': 'text', 'text': '<pre class="code-c">a</pre>'})
+			render_mock.assert_not_called()
+		self.assertEqual(response.content, b'<p>&lt;pre class=&quot;code-c&quot;&gt;a&lt;/pre&gt;</p>')
+
+	def test_raw(self):
+		text = '<pre class="code-c">a</pre>'
+		with mock.patch('rich_editor.views.render') as render_mock:
+			response = self.client.post(self.url, {'format': 'raw', 'text': text})
+			render_mock.assert_not_called()
+		self.assertEqual(response.content, text.encode('utf-8'))
+
+	def test_not_cached(self):
+		text = '<pre class="code-python">x = 1</pre>'
+		response = self.client.post(self.url, {'format': 'html', 'parser': 'full', 'text': text})
+		self.assertIn(b'<span', response.content)
+		self.assertIsNone(caches['default'].get(get_render_cache_key(text, 'full', 'html')))
+		self.assertIsNone(caches['default'].get(get_highlight_cache_key('x = 1', 'python')))
+
+	def test_rate_limit(self):
+		with mock.patch('rich_editor.views.PREVIEW_RATE_LIMIT', (2, 60)):
+			for __ in range(2):
+				self.assertEqual(self.client.post(self.url, {'text': 'text'}).status_code, 200)
+			self.assertEqual(self.client.post(self.url, {'text': 'text'}).status_code, 429)
+
+	def test_rate_limit_proxy(self):
+		with mock.patch('rich_editor.views.PREVIEW_RATE_LIMIT', (1, 60)), mock.patch('rich_editor.views.PREVIEW_CLIENT_IP_HEADER', 'HTTP_X_REAL_IP'):
+			self.assertEqual(self.client.post(self.url, {'text': 'text'}, HTTP_X_REAL_IP='10.0.0.1').status_code, 200)
+			self.assertEqual(self.client.post(self.url, {'text': 'text'}, HTTP_X_REAL_IP='10.0.0.2').status_code, 200)
+			self.assertEqual(self.client.post(self.url, {'text': 'text'}, HTTP_X_REAL_IP='10.0.0.1').status_code, 429)
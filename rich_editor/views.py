@@ -1,20 +1,63 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import time
+
 from braces.views import CsrfExemptMixin
+from django.conf import settings
+from django.core.cache import caches
 from django.views.generic import View
 from django.http.response import HttpResponse
 
-from rich_editor import get_parser
-from rich_editor.syntax import highlight_pre_blocks
+from common_utils import get_client_ip
+from rich_editor import get_parser, render
+
+
+PREVIEW_MAX_LENGTH = 500000
+PREVIEW_PLAIN_FORMATS = ('text', 'raw')
+# (počet požiadaviek, interval v sekundách) pre jedného klienta
+PREVIEW_RATE_LIMIT = getattr(settings, 'RICH_EDITOR_PREVIEW_RATE_LIMIT', (120, 60))
+# hlavička s adresou klienta, ktorú nastavuje dôveryhodná proxy (napr. HTTP_X_REAL_IP)
+PREVIEW_CLIENT_IP_HEADER = getattr(settings, 'RICH_EDITOR_PREVIEW_CLIENT_IP_HEADER', None)
+
+
+def get_preview_client_ip(request):
+	if PREVIEW_CLIENT_IP_HEADER and request.META.get(PREVIEW_CLIENT_IP_HEADER):
+		return request.META[PREVIEW_CLIENT_IP_HEADER]
+	return get_client_ip(request)
+
+
+def is_rate_limited(request):
+	if not PREVIEW_RATE_LIMIT:
+		return False
+	count, interval = PREVIEW_RATE_LIMIT
+	if request.user.is_authenticated:
+		client = 'user:%d' % request.user.pk
+	else:
+		client = 'ip:%s' % get_preview_client_ip(request)
+	key = 'rich_editor:preview_rate:%s:%d' % (client, int(time.time() // interval))
+	cache = caches['default']
+	if cache.add(key, 1, interval):
+		return False
+	try:
+		return cache.incr(key) > count
+	except ValueError: # expired between add and incr
+		return False
 
 
 class Preview(CsrfExemptMixin, View):
 	def post(self, request, **kwargs):
 		fmt = request.POST.get('format', 'html')
 		parser = request.POST.get('parser', '')
-		text = request.POST.get('text')[:500000] # ochrana
-		parser_instance = get_parser(parser, fmt)
-		parser_instance.parse(text)
-		parsed = parser_instance.get_output()
-		return HttpResponse(highlight_pre_blocks(parsed))
+		text = request.POST.get('text', '')[:PREVIEW_MAX_LENGTH] # ochrana
+
+		if is_rate_limited(request):
+			return HttpResponse('Príliš veľa požiadaviek', status=429)
+
+		if fmt in PREVIEW_PLAIN_FORMATS:
+			# escapovaný a neupravený text nepotrebuje cache ani zvýrazňovanie
+			output = get_parser(parser, fmt).clean(text)
+		else:
+			# koncepty sa neukladajú do zdieľanej cache
+			output = render(text, parser, fmt, cache=False)
+		return HttpResponse(output)
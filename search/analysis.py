@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Spracovanie textu pre vyhľadávanie: rozdelenie na slová, odstránenie
+diakritiky, stop slov a slovenský stemmer (prepis doc/sk_stem/stem_Unicode.sbl).
+"""
+from __future__ import unicode_literals
+
+import re
+
+from django.conf import settings
+
+
+WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+MAX_TERM_LENGTH = 100
+# kratší základ spája nesúvisiace slová (ma -> m)
+MIN_STEM_LENGTH = 3
+STEM_CACHE_SIZE = getattr(settings, 'SEARCH_STEM_CACHE_SIZE', 100000)
+
+ACCENTS = {
+	'á': 'a', 'ä': 'a', 'č': 'c', 'ď': 'd', 'é': 'e', 'ě': 'e', 'í': 'i',
+	'ĺ': 'l', 'ľ': 'l', 'ň': 'n', 'ô': 'o', 'ó': 'o', 'ŕ': 'r', 'ř': 'r',
+	'š': 's', 'ť': 't', 'ú': 'u', 'ů': 'u', 'ý': 'y', 'ž': 'z',
+}
+ACCENTS_TABLE = {ord(char): replacement for char, replacement in ACCENTS.items()}
+
+# pravidlo rule1, prípona -> náhrada
+SUFFIXES = dict(
+	[('nove', 'nove')] +
+	[(suffix, '') for suffix in (
+		'ovych', 'ovali', 'ovalo', 'ovala', 'ovymi', 'ovym', 'ovy', 'ova', 'ove', 'ovo', 'ovu', 'ovou', 'ovom', 'ovi', 'ovho', 'ovmu', 'ovej',
+		'ujeme', 'ujete', 'ujme', 'ujte', 'ujuc', 'ujes', 'ujem',
+		'ych', 'ymi', 'eho', 'emu', 'och',
+		'jte', 'jme', 'ska',
+		'om', 'ou', 'ej', 'ov', 'ym', 'te', 'me', 'ho', 'mu', 'in', 'mi',
+		'i', 'e', 'u', 'm', 'a',
+	)]
+)
+SUFFIX_LENGTHS = sorted(set(len(suffix) for suffix in SUFFIXES), reverse=True)
+
+STOPWORDS = frozenset((
+	'a', 'aby', 'aj', 'ak', 'ako', 'ale', 'alebo', 'ani', 'asi', 'az', 'bez',
+	'bol', 'bola', 'boli', 'bolo', 'by', 'bude', 'budu', 'cez', 'co', 'ci',
+	'do', 'ho', 'i', 'ich', 'im', 'ja', 'je', 'jeho', 'jej', 'ju', 'k', 'kde',
+	'ked', 'kto', 'ktora', 'ktore', 'ktori', 'ktory', 'len', 'ma', 'medzi',
+	'mi', 'mna', 'mne', 'my', 'na', 'nad', 'nam', 'nas', 'nie', 'o', 'od',
+	'on', 'ona', 'oni', 'ono', 'po', 'pod', 'pre', 'pred', 'pri', 's', 'sa',
+	'si', 'so', 'su', 'ta', 'tak', 'tam', 'ten', 'to', 'tu', 'tym', 'u', 'uz',
+	'v', 'vo', 'vsak', 'z', 'za', 'zo', 'ze',
+))
+
+terms_cache = {}
+
+
+def fold_accents(word):
+	return word.translate(ACCENTS_TABLE)
+
+
+def stem(word):
+	"""
+	Vráti základ slova. Slovo musí byť malými písmenami. Prípona sa nahradí
+	iba vtedy, ak zostane základ dlhý aspoň `MIN_STEM_LENGTH` znakov.
+	"""
+	word = fold_accents(word)
+	for length in SUFFIX_LENGTHS:
+		suffix = word[-length:]
+		if len(suffix) == length and suffix in SUFFIXES:
+			stemmed = word[:-length] + SUFFIXES[suffix]
+			if len(stemmed) >= MIN_STEM_LENGTH:
+				return stemmed
+	return word
+
+
+def get_term(word):
+	"""
+	Výraz pre slovo napísané malými písmenami, alebo None pre stop slová.
+	"""
+	try:
+		return terms_cache[word]
+	except KeyError:
+		pass
+	folded = fold_accents(word)
+	if folded in STOPWORDS:
+		term = None
+	else:
+		term = (stem(folded) or folded)[:MAX_TERM_LENGTH]
+	if len(terms_cache) >= STEM_CACHE_SIZE:
+		terms_cache.clear()
+	terms_cache[word] = term
+	return term
+
+
+def analyze(text):
+	"""
+	Rozdelí text na zoznam výrazov pre index.
+	"""
+	if not text:
+		return []
+	terms = []
+	for word in WORD_PATTERN.findall(text.lower()):
+		term = get_term(word)
+		if term is not None:
+			terms.append(term)
+	return terms
@@ -2,50 +2,75 @@
 # pylint: disable=abstract-method,too-many-locals,protected-access,no-member,unused-argument
 from __future__ import unicode_literals
 
-from django.db.models import Q
+import datetime
+import json
+import math
+import re
+from collections import Counter, OrderedDict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Q, Case, When, Value, F, Count, Sum, FloatField
 from django.utils import six
+from django.utils.dateparse import parse_date, parse_datetime
 from haystack import connections
-from haystack.backends import BaseEngine
+from haystack.backends import BaseEngine, BaseSearchBackend, SearchNode, log_query
 from haystack.backends.simple_backend import SimpleSearchBackend as CoreSimpleSearchBackend, SimpleSearchQuery
+from haystack.constants import ID, DJANGO_CT, DJANGO_ID
+from haystack.exceptions import NotHandled, SearchBackendError
 from haystack.models import SearchResult
-from haystack.utils import get_model_ct_tuple
+from haystack.utils import get_identifier, get_model_ct, get_model_ct_tuple
+from haystack.utils.app_loading import haystack_get_model
+
+from .analysis import analyze
+from .models import IndexDocument, IndexTerm
 
 
 class SimpleSearchBackend(CoreSimpleSearchBackend):
+	"""
+	Hľadá priamo v tabuľkách modelov. Počet výsledkov sa zisťuje cez COUNT,
+	načítavajú sa iba objekty z požadovaného rozsahu.
+	"""
+
+	def get_queryset(self, model, query_string):
+		queryset = model.objects.all()
+		if not queryset.ordered:
+			queryset = queryset.order_by('pk')
+		if query_string == '*':
+			return queryset
+
+		fields = [
+			field for field in model._meta.fields
+			if not hasattr(field, 'related') and field.get_internal_type() in ('TextField', 'CharField', 'SlugField')
+		]
+		if not fields:
+			return queryset.none()
+		for term in query_string.split():
+			queries = [Q(**{'%s__icontains' % field.name: term}) for field in fields]
+			queryset = queryset.filter(six.moves.reduce(lambda x, y: x | y, queries))
+		return queryset
+
+	@log_query
 	def search(self, query_string, **kwargs):
 		hits = 0
 		results = []
-		result_class = SearchResult
-		models = connections[self.connection_alias].get_unified_index().get_indexed_models()
-
-		if kwargs.get('result_class'):
-			result_class = kwargs['result_class']
-
-		if kwargs.get('models'):
-			models = kwargs['models']
+		result_class = kwargs.get('result_class') or SearchResult
+		start_offset = kwargs.get('start_offset') or 0
+		end_offset = kwargs.get('end_offset')
+		models = kwargs.get('models') or connections[self.connection_alias].get_unified_index().get_indexed_models()
 
 		if query_string:
-			for model in models:
-				if query_string == '*':
-					qs = model.objects.all()
-				else:
-					for term in query_string.split():
-						queries = []
-
-						for field in model._meta.fields:
-							if hasattr(field, 'related'):
-								continue
-
-							if not field.get_internal_type() in ('TextField', 'CharField', 'SlugField'):
-								continue
-
-							queries.append(Q(**{'%s__icontains' % field.name: term}))
-
-						qs = model.objects.filter(six.moves.reduce(lambda x, y: x | y, queries)) if queries else qs.none()
-
-				hits += len(qs)
+			for model in sorted(models, key=lambda model: model._meta.label):
+				queryset = self.get_queryset(model, query_string)
+				count = queryset.count()
+				# rozsah výsledkov, ktorý patrí tomuto modelu
+				model_start = max(start_offset - hits, 0)
+				model_end = count if end_offset is None else min(end_offset - hits, count)
+				hits += count
+				if model_start >= model_end:
+					continue
 
-				for match in qs:
+				for match in queryset[model_start:model_end]:
 					match.__dict__.pop('score', None)
 					app_label, model_name = get_model_ct_tuple(match)
 					result = result_class(app_label, model_name, match.pk, 0, **match.__dict__)
@@ -69,3 +94,230 @@ class SimpleSearchBackend(CoreSimpleSearchBackend):
 class SimpleEngine(BaseEngine):
 	backend = SimpleSearchBackend
 	query = SimpleSearchQuery
+
+
+def encode_stored_value(value):
+	# DjangoJSONEncoder skracuje mikrosekundy
+	if isinstance(value, (datetime.date, datetime.datetime)):
+		return value.isoformat()
+	return DjangoJSONEncoder().default(value)
+
+
+class IndexSearchBackend(BaseSearchBackend):
+	"""
+	Invertovaný index uložený v databáze (modely IndexDocument a IndexTerm).
+
+	Dokument obsahuje všetky hľadané výrazy, výsledky sú zoradené podľa
+	súčtu váh výrazov (tf) násobených ich idf.
+	"""
+
+	FIELD_BOOST = 2.0
+	NOT_PATTERN = re.compile(r'\bNOT\s+(\([^)]*\)|"[^"]*"|\S+)')
+	SORT_FIELDS = {'created': 'created', 'updated': 'updated'}
+
+	def get_terms(self, index, prepared):
+		terms = Counter()
+		for field_name, field in index.fields.items():
+			if not field.indexed or field.field_type not in ('string', 'edge_ngram', 'ngram'):
+				continue
+			value = prepared.get(field.index_fieldname)
+			if not value:
+				continue
+			boost = field.boost if field.document else field.boost * self.FIELD_BOOST
+			for term in analyze(six.text_type(value)):
+				terms[term] += boost
+		return terms
+
+	def get_stored_data(self, index, prepared):
+		data = {}
+		for field_name, field in index.fields.items():
+			if field.stored:
+				data[field_name] = prepared.get(field.index_fieldname)
+		return json.dumps(data, default=encode_stored_value)
+
+	def prepare_document(self, index, obj):
+		prepared = index.full_prepare(obj)
+		terms = self.get_terms(index, prepared)
+		length = math.log(1 + sum(terms.values()))
+		document = IndexDocument(
+			identifier=prepared[ID],
+			django_ct=prepared[DJANGO_CT],
+			django_id=prepared[DJANGO_ID],
+			created=prepared.get('created'),
+			updated=prepared.get('updated'),
+			data=self.get_stored_data(index, prepared),
+		)
+		weights = {term: math.log(1 + count) / (1 + length) for term, count in terms.items()}
+		return document, weights
+
+	def update(self, index, iterable, commit=True):
+		self.write_documents([self.prepare_document(index, obj) for obj in iterable])
+
+	def get_insert_terms_sql(self):
+		quote_name = connection.ops.quote_name
+		columns = [IndexTerm._meta.get_field(name).column for name in ('document', 'term', 'weight')]
+		return 'INSERT INTO %s (%s) VALUES (%%s, %%s, %%s)' % (
+			quote_name(IndexTerm._meta.db_table),
+			', '.join(quote_name(column) for column in columns)
+		)
+
+	def write_documents(self, documents):
+		"""
+		Zapíše dávku dokumentov z prepare_document v jednej transakcii. Pôvodné
+		dokumenty sa zmažú a vytvoria znovu cez bulk_create.
+		"""
+		documents = OrderedDict((document.identifier, (document, weights)) for document, weights in documents)
+		if not documents:
+			return
+
+		with transaction.atomic():
+			IndexDocument.objects.filter(identifier__in=list(documents.keys())).delete()
+			IndexDocument.objects.bulk_create([document for document, __ in documents.values()])
+			ids = dict(IndexDocument.objects
+				.filter(identifier__in=list(documents.keys()))
+				.values_list('identifier', 'pk'))
+			# bulk_create vytvára inštanciu modelu pre každý výraz, dávka má
+			# desaťtisíce výrazov
+			with connection.cursor() as cursor:
+				cursor.executemany(self.get_insert_terms_sql(), [
+					(ids[identifier], term, weight)
+					for identifier, (__, weights) in documents.items()
+					for term, weight in weights.items()
+				])
+
+	def remove(self, obj_or_string, commit=True):
+		IndexDocument.objects.filter(identifier=get_identifier(obj_or_string)).delete()
+
+	def clear(self, models=None, commit=True):
+		documents = IndexDocument.objects.all()
+		if models:
+			documents = documents.filter(django_ct__in=[get_model_ct(model) for model in models])
+		IndexTerm.objects.filter(document__in=documents).delete()
+		documents.delete()
+
+	def parse_query(self, query_string):
+		excluded = set()
+		for match in self.NOT_PATTERN.findall(query_string):
+			excluded.update(analyze(match))
+		query_string = self.NOT_PATTERN.sub(' ', query_string)
+		return set(analyze(query_string)) - excluded, excluded
+
+	def get_ordering(self, sort_by, prefix=''):
+		ordering = []
+		for field in sort_by or ():
+			descending = field.startswith('-')
+			field = self.SORT_FIELDS.get(field.lstrip('-'))
+			if field:
+				ordering.append(('-' if descending else '') + prefix + field)
+		return ordering
+
+	def make_results(self, rows, result_class):
+		documents = IndexDocument.objects.in_bulk([document_id for document_id, __ in rows])
+		unified_index = connections[self.connection_alias].get_unified_index()
+		results = []
+		for document_id, score in rows:
+			document = documents[document_id]
+			app_label, model_name = document.django_ct.split('.')
+			model = haystack_get_model(app_label, model_name)
+			try:
+				index = unified_index.get_index(model)
+			except NotHandled:
+				continue
+			data = json.loads(document.data)
+			for field_name, value in data.items():
+				field = index.fields.get(field_name)
+				if value and field is not None and field.field_type == 'datetime':
+					data[field_name] = parse_datetime(value)
+				elif value and field is not None and field.field_type == 'date':
+					data[field_name] = parse_date(value)
+			results.append(result_class(app_label, model_name, document.django_id, score, **data))
+		return results
+
+	@log_query
+	def search(self, query_string, **kwargs):
+		result_class = kwargs.get('result_class') or SearchResult
+		start_offset = kwargs.get('start_offset') or 0
+		end_offset = kwargs.get('end_offset')
+		empty = {'results': [], 'hits': 0, 'facets': {}, 'spelling_suggestion': None}
+
+		documents = IndexDocument.objects.all()
+		if kwargs.get('models'):
+			documents = documents.filter(django_ct__in=[get_model_ct(model) for model in kwargs['models']])
+
+		if not query_string:
+			return empty
+
+		if query_string.strip() == '*':
+			ordering = self.get_ordering(kwargs.get('sort_by')) + ['-pk']
+			hits = documents.count()
+			if hits <= start_offset:
+				return dict(empty, hits=hits)
+			rows = [(pk, 0) for pk in documents.order_by(*ordering).values_list('pk', flat=True)[start_offset:end_offset]]
+			return dict(empty, results=self.make_results(rows, result_class), hits=hits)
+
+		terms, excluded = self.parse_query(query_string)
+		if not terms:
+			return empty
+
+		document_frequencies = dict(IndexTerm.objects
+			.filter(term__in=terms)
+			.values_list('term')
+			.annotate(count=Count('id'))
+			.order_by())
+		if len(document_frequencies) < len(terms):
+			return empty
+		total = IndexDocument.objects.count()
+		idf = Case(
+			*[When(term=term, then=Value(math.log(1 + total / count))) for term, count in document_frequencies.items()],
+			output_field=FloatField()
+		)
+
+		matches = IndexTerm.objects.filter(term__in=terms)
+		if kwargs.get('models'):
+			matches = matches.filter(document__in=documents)
+		if excluded:
+			matches = matches.exclude(document__in=IndexTerm.objects.filter(term__in=excluded).values('document'))
+		matches = (matches
+			.values('document_id')
+			.annotate(matched=Count('id'), score=Sum(F('weight') * idf, output_field=FloatField()))
+			.filter(matched=len(terms)))
+
+		hits = matches.count()
+		if hits <= start_offset:
+			return dict(empty, hits=hits)
+		ordering = self.get_ordering(kwargs.get('sort_by'), prefix='document__') or ['-score']
+		rows = matches.order_by(*(ordering + ['-document_id'])).values_list('document_id', 'score')[start_offset:end_offset]
+		return dict(empty, results=self.make_results(list(rows), result_class), hits=hits)
+
+
+class IndexSearchQuery(SimpleSearchQuery):
+	"""
+	Index hľadá iba v obsahu dokumentu. Filtre podľa polí, OR, exclude
+	a narrow nie sú podporované a vyvolajú výnimku namiesto toho, aby sa
+	potichu ignorovali.
+	"""
+
+	CONTENT_FILTERS = ('content', 'contains')
+
+	def _build_sub_query(self, search_node):
+		if search_node.negated:
+			raise SearchBackendError("IndexEngine does not support exclude()")
+		if search_node.connector != SearchNode.AND and len(search_node.children) > 1:
+			raise SearchBackendError("IndexEngine does not support OR queries")
+		for child in search_node.children:
+			if isinstance(child, SearchNode):
+				continue
+			field, filter_type = search_node.split_expression(child[0])
+			if field != 'content' or filter_type not in self.CONTENT_FILTERS:
+				raise SearchBackendError("IndexEngine does not support field filter %s" % child[0])
+		return super(IndexSearchQuery, self)._build_sub_query(search_node)
+
+	def build_params(self, *args, **kwargs):
+		if self.narrow_queries:
+			raise SearchBackendError("IndexEngine does not support narrow()")
+		return super(IndexSearchQuery, self).build_params(*args, **kwargs)
+
+
+class IndexEngine(BaseEngine):
+	backend = IndexSearchBackend
+	query = IndexSearchQuery
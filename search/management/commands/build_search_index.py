@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import fcntl
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from haystack import connections as haystack_connections
+
+from common_utils import imap_in_order
+
+
+SEARCH_INDEX_LOCK_FILE = getattr(settings, 'SEARCH_INDEX_LOCK_FILE', os.path.join(tempfile.gettempdir(), 'shakal_search_index.lock'))
+
+
+class PreparedIndex(object):
+	"""
+	Index, ktorý vracia dokumenty pripravené v pracovných procesoch.
+	"""
+
+	def __init__(self, index, prepared):
+		self.index = index
+		self.prepared = prepared
+
+	def __getattr__(self, name):
+		return getattr(self.index, name)
+
+	def full_prepare(self, obj):
+		return self.prepared[obj.pk]
+
+
+def get_indexes(using, labels=None):
+	unified_index = haystack_connections[using].get_unified_index()
+	indexes = []
+	for model in sorted(unified_index.get_indexed_models(), key=lambda model: model._meta.label_lower):
+		if labels and model._meta.label_lower not in labels:
+			continue
+		indexes.append((model, unified_index.get_index(model)))
+	return indexes
+
+
+def iter_chunks(using, model, index, last_pk, chunk_size, start_date=None):
+	queryset = index.build_queryset(using=using, start_date=start_date).order_by('pk').values_list('pk', flat=True)
+	while True:
+		pks = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+		if not pks:
+			return
+		last_pk = pks[-1]
+		yield (using, model._meta.label_lower, pks)
+
+
+def prepare_chunk(chunk):
+	using, model_label, pks = chunk
+	backend = haystack_connections[using].get_backend()
+	index = haystack_connections[using].get_unified_index().get_index(apps.get_model(model_label))
+	objects = index.index_queryset(using=using).filter(pk__in=pks)
+	if hasattr(backend, 'write_documents'):
+		documents = [backend.prepare_document(index, obj) for obj in objects]
+	else:
+		documents = [(obj.pk, index.full_prepare(obj)) for obj in objects]
+	return pks[-1], len(pks), documents
+
+
+def write_chunk(backend, model, index, documents):
+	if hasattr(backend, 'write_documents'):
+		backend.write_documents(documents)
+	else:
+		# backend potrebuje z objektu iba model a primárny kľúč
+		prepared = OrderedDict(documents)
+		backend.update(PreparedIndex(index, prepared), [model(pk=pk) for pk in prepared])
+
+
+def acquire_lock(fp, wait):
+	try:
+		fcntl.flock(fp, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+		return True
+	except IOError:
+		return False
+
+
+class Command(BaseCommand):
+	help = 'Build search index in parallel, chunked by primary key'
+
+	def add_arguments(self, parser):
+		parser.add_argument('models', nargs='*', help='Model labels (app_label.model_name), default all indexed models')
+		parser.add_argument('--using', default='default', help='Haystack connection')
+		parser.add_argument('--processes', type=int, default=os.cpu_count(), help='Number of worker processes preparing documents')
+		parser.add_argument('--chunk-size', type=int, default=500)
+		parser.add_argument('--age', type=int, help='Index only objects updated in last AGE hours')
+		parser.add_argument('--clear', action='store_true', help='Remove documents of model before indexing it')
+		parser.add_argument('--checkpoint', help='JSON file with last indexed primary keys, used to resume interrupted run')
+		parser.add_argument('--wait', action='store_true', help='Wait for running build instead of exiting')
+
+	def load_checkpoint(self, path):
+		if path and os.path.exists(path):
+			with open(path) as fp:
+				return json.load(fp)
+		return {}
+
+	def save_checkpoint(self, path, checkpoint):
+		if not path:
+			return
+		with open(path + '.tmp', 'w') as fp:
+			json.dump(checkpoint, fp)
+		os.replace(path + '.tmp', path)
+
+	def handle(self, *args, **kwargs):
+		using = kwargs['using']
+		labels = set(label.lower() for label in kwargs['models'])
+		indexes = get_indexes(using, labels)
+		if labels and len(indexes) < len(labels):
+			raise CommandError("No search index for %s" % ', '.join(sorted(labels - set(model._meta.label_lower for model, __ in indexes))))
+
+		with open(SEARCH_INDEX_LOCK_FILE, 'a') as lock:
+			if not acquire_lock(lock, kwargs['wait']):
+				if int(kwargs['verbosity']) > 0:
+					self.stdout.write('Search index is already being built')
+				return
+			self.build(indexes, **kwargs)
+
+	def build(self, indexes, **kwargs):
+		using = kwargs['using']
+		backend = haystack_connections[using].get_backend()
+		checkpoint_path = kwargs['checkpoint']
+		checkpoint = self.load_checkpoint(checkpoint_path)
+		verbosity = int(kwargs['verbosity'])
+		start_date = timezone.now() - timedelta(hours=kwargs['age']) if kwargs['age'] else None
+
+		pool = None
+		if kwargs['processes'] > 1:
+			# workers must not share connections with parent process
+			connections.close_all()
+			for cache in caches.all():
+				cache.close()
+			pool = multiprocessing.Pool(kwargs['processes'])
+
+		try:
+			for model, index in indexes:
+				key = model._meta.label_lower
+				if key not in checkpoint:
+					if kwargs['clear']:
+						backend.clear(models=[model])
+					checkpoint[key] = 0
+					self.save_checkpoint(checkpoint_path, checkpoint)
+				chunks = iter_chunks(using, model, index, checkpoint[key], kwargs['chunk_size'], start_date)
+				results = imap_in_order(pool, prepare_chunk, chunks, kwargs['processes'] * 2) if pool else map(prepare_chunk, chunks)
+				start = time.time()
+				total = 0
+				for last_pk, count, documents in results:
+					write_chunk(backend, model, index, documents)
+					checkpoint[key] = last_pk
+					self.save_checkpoint(checkpoint_path, checkpoint)
+					total += count
+					if verbosity > 1:
+						self.stdout.write('%s: %d documents, %.0f docs/s' % (key, total, total / max(time.time() - start, 0.001)))
+				if verbosity > 0:
+					self.stdout.write('%s: %d documents in %.1fs, %.0f docs/s' % (key, total, time.time() - start, total / max(time.time() - start, 0.001)))
+		finally:
+			if pool:
+				pool.close()
+				pool.join()
+
+		# finished run starts from beginning next time
+		if checkpoint_path and os.path.exists(checkpoint_path):
+			os.remove(checkpoint_path)
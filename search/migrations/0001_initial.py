@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+	initial = True
+
+	dependencies = [
+	]
+
+	operations = [
+		migrations.CreateModel(
+			name='IndexDocument',
+			fields=[
+				('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+				('identifier', models.CharField(max_length=255, unique=True)),
+				('django_ct', models.CharField(db_index=True, max_length=100)),
+				('django_id', models.CharField(max_length=100)),
+				('created', models.DateTimeField(blank=True, db_index=True, null=True)),
+				('updated', models.DateTimeField(blank=True, db_index=True, null=True)),
+				('data', models.TextField()),
+			],
+			options={
+				'verbose_name': 'indexovaný dokument',
+				'verbose_name_plural': 'indexované dokumenty',
+			},
+		),
+		migrations.CreateModel(
+			name='IndexTerm',
+			fields=[
+				('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+				('term', models.CharField(max_length=100)),
+				('weight', models.FloatField()),
+				('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='search.IndexDocument')),
+			],
+			options={
+				'verbose_name': 'indexovaný výraz',
+				'verbose_name_plural': 'indexované výrazy',
+			},
+		),
+		migrations.AlterUniqueTogether(
+			name='indexterm',
+			unique_together={('term', 'document')},
+		),
+	]
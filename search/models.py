@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models
+
+
+class IndexDocument(models.Model):
+	identifier = models.CharField(max_length=255, unique=True)
+	django_ct = models.CharField(max_length=100, db_index=True)
+	django_id = models.CharField(max_length=100)
+	created = models.DateTimeField(blank=True, null=True, db_index=True)
+	updated = models.DateTimeField(blank=True, null=True, db_index=True)
+	data = models.TextField()
+
+	class Meta:
+		verbose_name = 'indexovaný dokument'
+		verbose_name_plural = 'indexované dokumenty'
+
+
+class IndexTerm(models.Model):
+	document = models.ForeignKey(IndexDocument, related_name='terms', on_delete=models.CASCADE)
+	term = models.CharField(max_length=100)
+	weight = models.FloatField()
+
+	class Meta:
+		unique_together = (('term', 'document'),)
+		verbose_name = 'indexovaný výraz'
+		verbose_name_plural = 'indexované výrazy'
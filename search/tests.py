@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import os
+import tempfile
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from haystack import connections
+from haystack.exceptions import SearchBackendError
+from haystack.query import SearchQuerySet
+
+from .analysis import analyze, stem
+from .backends import SimpleSearchBackend
+from .models import IndexDocument, IndexTerm
+from article.models import Article, Category
+from rich_editor.widgets import TextVal
+
+
+class AnalysisTest(TestCase):
+	def test_stem(self):
+		self.assertEqual(stem('linuxová'), 'linux')
+		self.assertEqual(stem('distribúcia'), 'distribuci')
+		self.assertEqual(stem('nové'), 'nove')
+		self.assertEqual(stem('ovládačov'), 'ovladac')
+
+	def test_stem_short(self):
+		self.assertEqual(stem('ma'), 'ma')
+		self.assertEqual(stem('mu'), 'mu')
+		self.assertEqual(stem('ovu'), 'ovu')
+		self.assertEqual(stem('domov'), 'dom')
+		self.assertEqual(stem('pesom'), 'pes')
+		self.assertNotEqual(stem('mám'), stem('mi'))
+
+	def test_analyze(self):
+		self.assertEqual(analyze('Linuxová distribúcia je na SERVERI'), ['linux', 'distribuci', 'server'])
+		self.assertEqual(analyze('a je na'), [])
+		self.assertEqual(analyze(''), [])
+
+
+class SearchTestMixin(object):
+	def setUp(self):
+		self.category = Category.objects.create(name='category', slug='category')
+		self.index = connections['default'].get_unified_index().get_index(Article)
+		self.linux = self.create_article('Linux jadro', 'Vyšlo nové jadro linux', timezone.now() - timedelta(1))
+		self.debian = self.create_article('Debian', 'Debian používa jadro linux', timezone.now() - timedelta(2))
+		self.other = self.create_article('Iné', 'Nič', timezone.now() - timedelta(3))
+		self.index.update()
+
+	def create_article(self, title, content, pub_time):
+		return Article.objects.create(title=title, slug=title.lower().replace(' ', '-'), category=self.category, authors_name='autor', original_content=TextVal('raw:' + content), pub_time=pub_time, published=True)
+
+	def search(self, query):
+		return [int(result.pk) for result in SearchQuerySet().models(Article).auto_query(query)]
+
+
+class IndexSearchBackendTest(SearchTestMixin, TestCase):
+	def test_search(self):
+		self.assertEqual(self.search('linux'), [self.linux.pk, self.debian.pk])
+		self.assertEqual(self.search('debian jadro'), [self.debian.pk])
+		self.assertEqual(self.search('linux -debian'), [self.linux.pk])
+		self.assertEqual(self.search('linux neexistuje'), [])
+
+	def test_search_stemmed(self):
+		self.assertEqual(self.search('debianu'), [self.debian.pk])
+		self.assertEqual(self.search('pouziva'), [self.debian.pk])
+		self.assertEqual(self.search('linuxové'), [self.linux.pk, self.debian.pk])
+
+	def test_ordering(self):
+		results = SearchQuerySet().models(Article).all().order_by('created')
+		self.assertEqual([int(result.pk) for result in results], [self.other.pk, self.debian.pk, self.linux.pk])
+		self.assertEqual(results[0].created, self.other.pub_time)
+
+	def test_unsupported_filters(self):
+		with self.assertRaises(SearchBackendError):
+			list(SearchQuerySet().models(Article).filter(title='Debian'))
+		with self.assertRaises(SearchBackendError):
+			list(SearchQuerySet().models(Article).auto_query('linux').exclude(content='debian'))
+		with self.assertRaises(SearchBackendError):
+			list(SearchQuerySet().models(Article).narrow('title:Debian'))
+
+	def test_update(self):
+		self.debian.original_content = TextVal('raw:Zmena')
+		self.debian.save()
+		self.index.update_object(self.debian)
+		self.assertEqual(self.search('linux'), [self.linux.pk])
+		self.index.remove_object(self.linux)
+		self.assertEqual(self.search('linux'), [])
+		self.index.clear()
+		self.assertFalse(IndexDocument.objects.exists())
+		self.assertFalse(IndexTerm.objects.exists())
+
+
+class SimpleSearchBackendTest(TestCase):
+	def setUp(self):
+		category = Category.objects.create(name='category', slug='category')
+		self.articles = [
+			Article.objects.create(title='Linux %d' % i, slug='linux-%d' % i, category=category, authors_name='autor', original_content=TextVal('raw:jadro'), pub_time=timezone.now(), published=True)
+			for i in range(5)
+		]
+		self.backend = SimpleSearchBackend('default')
+
+	def test_search_page(self):
+		with self.assertNumQueries(2):
+			results = self.backend.search('linux jadro', models=[Article], start_offset=1, end_offset=3)
+		self.assertEqual(results['hits'], 5)
+		self.assertEqual([result.pk for result in results['results']], [article.pk for article in self.articles[3:1:-1]])
+
+	def test_count_only(self):
+		with self.assertNumQueries(1):
+			results = self.backend.search('linux', models=[Article], start_offset=5, end_offset=6)
+		self.assertEqual(results, {'results': [], 'hits': 5})
+		self.assertEqual(self.backend.search('linux neexistuje', models=[Article])['hits'], 0)
+
+
+class BuildSearchIndexTest(SearchTestMixin, TestCase):
+	def setUp(self):
+		super(BuildSearchIndexTest, self).setUp()
+		self.index.clear()
+		self.checkpoint = os.path.join(tempfile.mkdtemp(), 'checkpoint.json')
+
+	def tearDown(self):
+		os.rmdir(os.path.dirname(self.checkpoint))
+
+	def build(self, **kwargs):
+		call_command('build_search_index', 'article.article', processes=1, chunk_size=2, checkpoint=self.checkpoint, verbosity=0, **kwargs)
+
+	def test_build(self):
+		self.build(clear=True)
+		self.assertEqual(self.search('linux'), [self.linux.pk, self.debian.pk])
+		self.assertFalse(os.path.exists(self.checkpoint))
+
+	def test_resume(self):
+		with open(self.checkpoint, 'w') as fp:
+			json.dump({'article.article': self.linux.pk}, fp)
+		self.build(clear=True)
+		self.assertEqual(self.search('linux'), [self.debian.pk])
+		self.assertEqual(IndexDocument.objects.count(), 2)
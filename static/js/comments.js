@@ -0,0 +1,57 @@
+(function(_) {
+
+var loadWindow = function(link) {
+	var container = _.findParentByCls(link, 'comments-window');
+	if (container === null) {
+		return;
+	}
+	var req = new XMLHttpRequest();
+	req.open('GET', link.getAttribute('href'), true);
+	req.setRequestHeader('X-Requested-With', 'XMLHttpRequest');
+	req.onreadystatechange = function() {
+		if (req.readyState !== 4) {
+			return;
+		}
+		if (req.status !== 200) {
+			window.location = link.getAttribute('href');
+			return;
+		}
+		var content = document.createElement('DIV');
+		content.innerHTML = req.responseText;
+		while (content.firstChild) {
+			container.parentNode.insertBefore(content.firstChild, container);
+		}
+		container.parentNode.removeChild(container);
+	};
+	req.send();
+};
+
+var onBodyClicked = function(e) {
+	if (e.which !== 1) {
+		return;
+	}
+	var element = e.target;
+	if (!_.hasClass(element, 'comments-window-link')) {
+		return;
+	}
+	e.preventDefault();
+	loadWindow(element);
+};
+
+var showLinkedComment = function() {
+	// komentár z odkazu #link_<id> nemusí byť v načítaných oknách
+	var match = /^#link_(\d+)$/.exec(window.location.hash);
+	if (match === null || document.getElementById('link_' + match[1]) !== null) {
+		return;
+	}
+	if (document.querySelector('.comments-window-link') === null) {
+		return;
+	}
+	var separator = window.location.search ? '&' : '?';
+	window.location = window.location.pathname + window.location.search + separator + 'comment=' + match[1] + window.location.hash;
+};
+
+_.bindEvent(document.body, 'click', onBodyClicked);
+showLinkedComment();
+
+}(_utils));
@@ -562,16 +562,25 @@ var SimpleEditorHtml = function(element, options) {
 
 	var buttons = {};
 
+	var lastPreview = {data: null, response: null};
+
 	var updatePreview = function() {
 		var text = element.value;
-		preview.contentDocument.body.innerHTML = text;
 		var format = options.format;
 		var parser = options.parsers[format];
+		var data = 'format=' + encodeURIComponent(format) + '&parser=' + encodeURIComponent(parser) + '&text=' + encodeURIComponent(text);
+		if (data === lastPreview.data) {
+			preview.contentDocument.body.innerHTML = lastPreview.response;
+			return;
+		}
+		preview.contentDocument.body.innerHTML = text;
 		_.xhrSend({
 			method: 'POST',
 			url: options.preview,
-			data: 'format=' + encodeURIComponent(format) + '&parser=' + encodeURIComponent(parser) + '&text=' + encodeURIComponent(text),
+			data: data,
 			successFn: function(response) {
+				lastPreview.data = data;
+				lastPreview.response = response;
 				preview.contentDocument.body.innerHTML = response;
 			}
 		});
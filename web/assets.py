@@ -160,4 +160,8 @@ ASSETS = {
 		"js": "static://js/toggle.js",
 		'depends': ['utils_ajax'],
 	},
+	"comments": {
+		"js": "static://js/comments.js",
+		'depends': ['utils_ajax'],
+	},
 }
@@ -301,9 +301,10 @@ ATTACHMENT_SIZE_FOR_CONTENT = {
 	'blog_post': 1024 * 1024 * 8,
 }
 
+# index je po nasadení prázdny, treba ho naplniť príkazom build_search_index
 HAYSTACK_CONNECTIONS = {
 	'default': {
-		'ENGINE': 'search.backends.SimpleEngine',
+		'ENGINE': 'search.backends.IndexEngine',
 	},
 }
 
@@ -18,4 +18,32 @@ INSTALLED_APPS += (
 #		'INCLUDE_SPELLING': False
 #	},
 #}
-#HAYSTACK_XAPIAN_LANGUAGE = 'sk'
+#HAYSTACK_XAPIAN_LANGUAGE = 'sk' # stemmer zo search.analysis, netreba upravený Xapian
+# Bez Xapianu sa používa index v databáze (search.backends.IndexEngine),
+# ktorý aktualizuje príkaz build_search_index (doc/cron/crontab).
+# Súbor zámku, ktorý zabráni súčasnému behu viacerých build_search_index.
+#SEARCH_INDEX_LOCK_FILE = os.path.join(BASE_DIR, 'search_index.lock')
+
+# Zobrazenia sa zbierajú v zdieľanej cache (memcached / redis) a do databázy
+# sa zapisujú príkazom linuxos_cron, alebo hitcount_flush.
+#HITCOUNT_WRITE_BEHIND = True
+
+# Úlohy po uložení komentára (hlavička diskusie, notifikácie, hodnotenie)
+# sa spúšťajú po potvrdení transakcie. Predvolene ich vykonáva vlákno
+# v procese, ktoré pri ukončení procesu dokončí čakajúce úlohy (najviac
+# DEFERRED_TASKS_DRAIN_TIMEOUT sekúnd). Pri páde procesu sa úlohy stratia.
+# Backend database ich ukladá do databázy pre príkaz run_deferred_tasks --loop,
+# ktorý môže bežať aj vo viacerých procesoch.
+#DEFERRED_TASKS_BACKEND = 'database'
+
+# Bloky kódu dlhšie ako zadaný počet znakov sa pri uložení zvýraznia
+# na pozadí. Zvýrazňovanie je možné rozdeliť medzi viacero procesov.
+#RICH_EDITOR_BACKGROUND_HIGHLIGHT_LENGTH = 20000
+#RICH_EDITOR_HIGHLIGHT_PROCESSES = 2
+
+# Maximálny počet náhľadov editora na klienta za interval v sekundách.
+# Anonymní používatelia sa počítajú podľa IP adresy. Za reverznou proxy
+# treba nastaviť hlavičku, do ktorej proxy zapisuje adresu klienta (a ktorú
+# od klienta neprepúšťa), inak majú všetci anonymní používatelia jeden limit.
+#RICH_EDITOR_PREVIEW_RATE_LIMIT = (120, 60)
+#RICH_EDITOR_PREVIEW_CLIENT_IP_HEADER = 'HTTP_X_REAL_IP'
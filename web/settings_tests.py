@@ -9,3 +9,4 @@ CAPTCHA_DISABLE = True
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/accounts/me/'
+DEFERRED_TASKS_BACKEND = 'immediate'
@@ -38,7 +38,7 @@ def error_404(request, exception, template_name='404.html'):
 class Home(TemplateView):
 	template_name = 'home.html'
 
-	@cached_method(tag='article.article')
+	@cached_method(tag='article.article', stale_age=60)
 	def get_articles(self):
 		DEFER = ('original_content', 'filtered_content', 'original_annotation', 'filtered_annotation')
 		try:
@@ -63,14 +63,14 @@ class Home(TemplateView):
 		posts = Post.objects.all()
 		return list(posts[:4]), list(top_posts)
 
-	@cached_method(tag='forum.topic')
+	@cached_method(tag='forum.topic', max_age=3600, stale_age=600, models=('forum.topic', 'comments.rootheader'))
 	def get_topics(self):
 		forum_new = list(ForumTopic.topics.newest_comments()[:20])
 		forum_no_comments = list(ForumTopic.topics.no_comments()[:5])
 		forum_most_comments = list(ForumTopic.topics.most_commented()[:5])
 		return forum_new, forum_no_comments, forum_most_comments
 
-	@cached_method(tag='desktops.desktop')
+	@cached_method(tag='desktops.desktop', max_age=3600)
 	def get_desktops(self):
 		return list(Desktop.objects.select_related('author').order_by('-pk')[:4])
 